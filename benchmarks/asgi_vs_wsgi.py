@@ -0,0 +1,89 @@
+"""
+Concurrency benchmark of the wallet status endpoint under WSGI and ASGI.
+
+Runs entirely in-process against a throwaway database:
+  * wsgi-sync:  DRF view through the WSGI handler, one thread per concurrent request
+  * asgi-sync:  DRF view through the ASGI handler (Django runs it in a thread)
+  * asgi-async: async view (wallets/async_views.py) through the ASGI handler, on the event loop
+
+Usage: python -m benchmarks.asgi_vs_wsgi --requests 2000 --concurrency 64
+Prints a JSON report on stdout.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import Timer, seed, setup_django, summarize
+
+
+def run_wsgi(user, url, requests, concurrency):
+    from django.test import Client
+    session = Client()
+    session.force_login(user)
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies = session.cookies
+        client = local.client
+        start = time.perf_counter()
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, Timer() as timer:
+        latencies = list(pool.map(one, range(requests)))
+    return summarize(latencies, timer.elapsed)
+
+
+def run_asgi(user, url, requests, concurrency):
+    from django.test import AsyncClient
+
+    async def main():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                assert response.status_code == 200, response.status_code
+                return time.perf_counter() - start
+
+        with Timer() as timer:
+            latencies = await asyncio.gather(*[one() for _ in range(requests)])
+        return summarize(latencies, timer.elapsed)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        merchant, users, wallets = seed(clients=1)
+        user, wallet = users[0], wallets[0]
+        report = {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'wsgi-sync': run_wsgi(user, f'/wallets/wallets/{wallet.token}/', args.requests, args.concurrency),
+            'asgi-sync': run_asgi(user, f'/wallets/wallets/{wallet.token}/', args.requests, args.concurrency),
+            'asgi-async': run_asgi(user, '/wallets/async/wallet/', args.requests, args.concurrency),
+        }
+    finally:
+        teardown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
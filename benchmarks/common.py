@@ -0,0 +1,86 @@
+"""
+Helpers shared by the benchmark scripts: Django bootstrap on a throwaway database,
+data seeding and latency statistics.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+
+
+def setup_django(database=True):
+    """
+    Configure Django and create an empty throwaway test database, returns its teardown callable.
+    With database=False only Django is configured.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wallet_service.settings')
+    import django
+    django.setup()
+    if not database:
+        return lambda: None
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    settings.ALLOWED_HOSTS = ['testserver']
+    # Benchmarks measure the endpoints, not the rate limits
+    settings.TOKEN_BUCKET_RATES = {}
+    old_name = connection.settings_dict['NAME']
+    if connection.vendor == 'sqlite':
+        # A file database: the default shared in-memory one locks whole tables across threads
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed(clients=10, transactions_per_wallet=10):
+    """ Create one merchant and `clients` clients, each with a funded wallet and some history """
+    from django.contrib.auth.hashers import make_password
+    from users.models import User
+    from wallets.models import LedgerEntry, Wallet, Transaction
+
+    password = make_password('benchmark')
+    merchant = User.objects.create(email='merchant@bench.local', user_type='merchant', password=password)
+    Wallet.objects.bulk_create([Wallet(user=merchant, is_merchant=True)])
+    users = User.objects.bulk_create([
+        User(email=f'client{i}@bench.local', user_type='client', password=password) for i in range(clients)
+    ])
+    wallets = Wallet.objects.bulk_create([Wallet(user=user, balance=Decimal('1000000')) for user in users])
+    history = Transaction.objects.bulk_create([
+        Transaction(wallet=wallet, amount=Decimal('1.00'), transaction_type='recharge')
+        for wallet in wallets for _ in range(transactions_per_wallet)
+    ])
+    LedgerEntry.objects.bulk_create([
+        LedgerEntry(transaction_id=txn.pk, wallet=wallet, amount=amount, created_at=txn.created_at)
+        for txn in history for wallet, amount in ((txn.wallet, txn.amount), (None, -txn.amount))
+    ])
+    return merchant, users, wallets
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    """ Latency percentiles in milliseconds and throughput in requests per second """
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,100 @@
+"""
+Throughput of a mixed charge/list workload under the database profiles.
+
+Each profile runs in its own process (settings are read from the environment at startup)
+against a throwaway database, with concurrent threads sending requests through the WSGI
+handler, authenticated with bearer tokens:
+  * sqlite-default: SQLite with its default rollback journal (SQLITE_TUNING=0)
+  * sqlite-wal:     SQLite with the WAL / synchronous=NORMAL / mmap PRAGMAs
+  * postgresql:     DATABASE_PROFILE=postgresql, connection details from the POSTGRES_* variables
+
+Usage: python -m benchmarks.database_profiles --requests 2000 --concurrency 16 --charge-ratio 0.3
+Prints a JSON report on stdout.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import Timer, seed, setup_django, summarize
+
+PROFILES = {
+    'sqlite-default': {'DATABASE_PROFILE': 'sqlite', 'SQLITE_TUNING': '0'},
+    'sqlite-wal': {'DATABASE_PROFILE': 'sqlite', 'SQLITE_TUNING': '1'},
+    'postgresql': {'DATABASE_PROFILE': 'postgresql'},
+}
+
+
+def run_workload(requests, concurrency, charge_ratio, clients):
+    """ Run the mixed workload in this process, returns its summary """
+    teardown = setup_django()
+    try:
+        from django.db import connection
+        from django.test import Client
+        from users.authentication import issue_token
+        merchant, users, wallets = seed(clients=clients, transactions_per_wallet=20)
+        merchant_auth = f'Bearer {issue_token(merchant)}'
+        client_auth = [f'Bearer {issue_token(user)}' for user in users]
+        local = threading.local()
+        errors = []
+
+        def one(index):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            rng = random.Random(index)
+            slot = rng.randrange(len(wallets))
+            start = time.perf_counter()
+            if rng.random() < charge_ratio:
+                response = local.client.post(f'/wallets/wallets/{wallets[slot].token}/charge/', {'amount': '1.00'},
+                                             content_type='application/json', HTTP_AUTHORIZATION=merchant_auth)
+            else:
+                response = local.client.get('/wallets/transactions/', HTTP_AUTHORIZATION=client_auth[slot])
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool, Timer() as timer:
+            latencies = list(pool.map(one, range(requests)))
+        result = summarize(latencies, timer.elapsed)
+        result.update(errors=len(errors), vendor=connection.vendor)
+        return result
+    finally:
+        teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--charge-ratio', type=float, default=0.3, help="Share of the requests that are charges")
+    parser.add_argument('--clients', type=int, default=50, help="Number of seeded client wallets")
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES), help="Profiles to run (repeatable, default: the SQLite ones)")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_workload(args.requests, args.concurrency, args.charge_ratio, args.clients)))
+        return
+
+    report = {'requests': args.requests, 'concurrency': args.concurrency, 'charge_ratio': args.charge_ratio, 'profiles': {}}
+    for name in args.profile or ['sqlite-default', 'sqlite-wal']:
+        env = dict(os.environ, DJANGO_DEBUG='0', **PROFILES[name])
+        command = [sys.executable, '-m', 'benchmarks.database_profiles', '--child',
+                   '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+                   '--charge-ratio', str(args.charge_ratio), '--clients', str(args.clients)]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            report['profiles'][name] = {'error': completed.stderr.strip().splitlines()[-1:]}
+        else:
+            report['profiles'][name] = json.loads(completed.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
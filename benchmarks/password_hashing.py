@@ -0,0 +1,74 @@
+"""
+Throughput/latency tradeoff of the password hashers at different work factors.
+
+For every (algorithm, work factor) pair it hashes --hashes passwords through the bounded
+hashing pool of users.hashers with --concurrency callers, and reports the latency of a single
+hash and the hashes per second achieved by the process.
+
+Usage: python -m benchmarks.password_hashing --hashes 64 --concurrency 8 --workers 4
+Argon2 is skipped when argon2-cffi is not installed.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import Timer, setup_django, summarize
+
+SETTINGS = [
+    ('pbkdf2', 'PASSWORD_PBKDF2_ITERATIONS', [100_000, 260_000, 600_000, 1_000_000]),
+    ('scrypt', 'PASSWORD_SCRYPT_WORK_FACTOR', [2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15]),
+    ('argon2', 'PASSWORD_ARGON2_TIME_COST', [1, 2, 3, 4]),
+]
+
+
+def argon2_available():
+    try:
+        import argon2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run(algorithm, setting, value, hashes, concurrency):
+    from django.test import override_settings
+    from users import hashers
+
+    hasher_path = f'users.hashers.{ {"pbkdf2": "PBKDF2", "scrypt": "Scrypt", "argon2": "Argon2"}[algorithm]}PasswordHasher'
+    with override_settings(PASSWORD_HASHERS=[hasher_path], **{setting: value}):
+        def one(index):
+            start = time.perf_counter()
+            hashers.make_password(f'password-{index}')
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as callers, Timer() as timer:
+            latencies = list(callers.map(one, range(hashes)))
+    return summarize(latencies, timer.elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--hashes', type=int, default=32, help="Hashes per setting")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent callers")
+    parser.add_argument('--workers', type=int, help="Size of the hashing pool (PASSWORD_HASHING_WORKERS)")
+    args = parser.parse_args()
+
+    setup_django(database=False)
+    from django.conf import settings
+    if args.workers:
+        settings.PASSWORD_HASHING_WORKERS = args.workers
+        settings.PASSWORD_HASHING_MAX_PENDING = args.workers * 8
+
+    report = {'hashes': args.hashes, 'concurrency': args.concurrency, 'workers': settings.PASSWORD_HASHING_WORKERS, 'results': []}
+    for algorithm, setting, values in SETTINGS:
+        if algorithm == 'argon2' and not argon2_available():
+            continue
+        for value in values:
+            result = run(algorithm, setting, value, args.hashes, args.concurrency)
+            report['results'].append({'algorithm': algorithm, setting: value, **result})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
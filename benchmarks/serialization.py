@@ -0,0 +1,57 @@
+"""
+Rows per second of the transaction list serialization: TransactionSerializer rendered by DRF's
+JSONRenderer against the values() based fast path of wallets.fast_serializers.
+
+Seeds --rows transactions, serializes them all --repeat times with both, checks the outputs are
+byte-identical and reports the best time and rows/second of each.
+
+Usage: python -m benchmarks.serialization --rows 100000 --repeat 3
+"""
+
+import argparse
+import json
+
+from .common import Timer, seed, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100_000, help="Transactions to serialize")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per implementation, the best one is kept")
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from rest_framework.renderers import JSONRenderer
+        from wallets import fast_serializers
+        from wallets.models import TransactionHistory
+        from wallets.serializers import TransactionSerializer
+
+        clients = max(1, args.rows // 1000)
+        seed(clients=clients, transactions_per_wallet=-(-args.rows // clients))
+        queryset = TransactionHistory.objects.order_by('-created_at', '-id')[:args.rows]
+
+        def drf():
+            return JSONRenderer().render(TransactionSerializer(queryset.select_related('wallet'), many=True).data)
+
+        def fast():
+            return fast_serializers.dumps(fast_serializers.transactions(queryset.values(**fast_serializers.transaction_values())))
+
+        report = {'rows': args.rows, 'encoder': 'orjson' if fast_serializers.orjson is not None else 'json', 'results': []}
+        outputs = {}
+        for name, func in (('serializer', drf), ('fast', fast)):
+            timings = []
+            for _ in range(args.repeat):
+                with Timer() as timer:
+                    outputs[name] = func()
+                timings.append(timer.elapsed)
+            best = min(timings)
+            report['results'].append({'implementation': name, 'best_s': round(best, 3), 'rows_per_s': round(args.rows / best)})
+        report['identical'] = outputs['serializer'] == outputs['fast']
+        print(json.dumps(report, indent=2))
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
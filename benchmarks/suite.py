@@ -0,0 +1,186 @@
+"""
+Load-test and micro-benchmark suite for the wallet API.
+
+Seeds a throwaway database (SQLite file, or a test_ database on whatever server the
+settings point at, e.g. a local PostgreSQL) and drives the main endpoints in-process through
+the Django test client, either via the WSGI handler or the ASGI handler:
+
+  register           POST /users/register/client/
+  wallet-create      POST /wallets/wallets/
+  recharge           POST /wallets/wallets/{token}/recharge/
+  charge             POST /wallets/wallets/{token}/charge/
+  transaction-list   GET  /wallets/transactions/
+  client-wallets     GET  /wallets/client-wallets/
+
+For every scenario it reports p50/p95/p99 latency, throughput and database queries per
+request (queries are only counted with the WSGI handler, ASGI runs the views in another thread).
+
+Usage:
+  python -m benchmarks.suite --clients 1000 --transactions 20 --requests 500 --output results.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from .common import Timer, seed, setup_django, summarize
+
+SCENARIOS = ['register', 'wallet-create', 'recharge', 'charge', 'transaction-list', 'client-wallets']
+
+
+class WSGIHarness:
+    """ Sends requests through the WSGI handler and counts the queries each one runs """
+
+    name = 'wsgi'
+
+    def __init__(self, user):
+        from django.test import Client
+        self.client = Client()
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, url, data=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = self.client.generic(method, url, json.dumps(data) if data is not None else '', content_type='application/json')
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries)
+
+    def close(self):
+        pass
+
+
+class ASGIHarness:
+    """ Sends requests through the ASGI handler, one at a time, on a private event loop """
+
+    name = 'asgi'
+
+    def __init__(self, user):
+        from django.test import AsyncClient
+        self.loop = asyncio.new_event_loop()
+        self.client = AsyncClient()
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, url, data=None):
+        start = time.perf_counter()
+        response = self.loop.run_until_complete(
+            self.client.generic(method, url, json.dumps(data) if data is not None else '', content_type='application/json')
+        )
+        return response.status_code, time.perf_counter() - start, None
+
+    def close(self):
+        self.loop.close()
+
+
+HARNESSES = {'wsgi': WSGIHarness, 'asgi': ASGIHarness}
+
+
+def scenario_requests(name, context):
+    """ Yield (user, method, url, data) for every request of a scenario """
+    merchant, clients, wallets, admin = context['merchant'], context['clients'], context['wallets'], context['admin']
+    counter = itertools.count()
+    pairs = itertools.cycle(zip(clients, wallets))
+    while True:
+        client, wallet = next(pairs)
+        if name == 'register':
+            yield None, 'POST', '/users/register/client/', {'email': f'new{next(counter)}@bench.local', 'password': 'benchmark-pass', 'user_type': 'client'}
+        elif name == 'wallet-create':
+            # Creating wallets through the API requires model permissions, only superusers have them
+            yield admin, 'POST', '/wallets/wallets/', {'user': admin.pk}
+        elif name == 'recharge':
+            yield client, 'POST', f'/wallets/wallets/{wallet.token}/recharge/', {'token': str(wallet.token), 'amount': '1.00'}
+        elif name == 'charge':
+            yield merchant, 'POST', f'/wallets/wallets/{wallet.token}/charge/', {'amount': '1.00'}
+        elif name == 'transaction-list':
+            yield client, 'GET', '/wallets/transactions/', None
+        elif name == 'client-wallets':
+            yield merchant, 'GET', '/wallets/client-wallets/', None
+
+
+def run_scenario(name, context, harness_class, requests, warmup):
+    latencies, queries, errors = [], [], 0
+    harnesses = {}
+    try:
+        for index, (user, method, url, data) in enumerate(itertools.islice(scenario_requests(name, context), requests + warmup)):
+            key = user.pk if user is not None else None
+            if key not in harnesses:
+                harnesses[key] = harness_class(user)
+            status, elapsed, query_count = harnesses[key].request(method, url, data)
+            if index < warmup:
+                continue
+            if status >= 400:
+                errors += 1
+            latencies.append(elapsed)
+            if query_count is not None:
+                queries.append(query_count)
+    finally:
+        for harness in harnesses.values():
+            harness.close()
+    result = summarize(latencies, sum(latencies))
+    result['errors'] = errors
+    result['queries_per_request'] = round(statistics.fmean(queries), 2) if queries else None
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=100, help="Number of seeded client users/wallets")
+    parser.add_argument('--transactions', type=int, default=10, help="Seeded transactions per wallet")
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per scenario")
+    parser.add_argument('--handler', choices=sorted(HARNESSES), default='wsgi')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Only run these scenarios (repeatable)")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    teardown = setup_django()
+    try:
+        from django.db import connection
+        from users.models import User
+        with Timer() as seeding:
+            merchant, clients, wallets = seed(args.clients, args.transactions)
+            admin = User.objects.create_superuser('admin@bench.local', 'benchmark')
+        context = {'merchant': merchant, 'clients': clients, 'wallets': wallets, 'admin': admin}
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'handler': args.handler,
+            'clients': args.clients,
+            'transactions_per_wallet': args.transactions,
+            'seed_seconds': round(seeding.elapsed, 3),
+            'scenarios': {
+                name: run_scenario(name, context, HARNESSES[args.handler], args.requests, args.warmup)
+                for name in (args.scenario or SCENARIOS)
+            },
+        }
+    finally:
+        teardown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Stateless bearer token authentication.
+
+Tokens are signed (HMAC with SECRET_KEY, see django.core.signing) and carry the user id,
+user_type and staff flags, so a request authenticated with "Authorization: Bearer <token>"
+needs neither the session row nor the users row: the principal is rebuilt from the token and
+kept in a small per-process LRU cache (AUTH_TOKEN_CACHE_SIZE entries).
+
+Tokens expire after AUTH_TOKEN_TTL seconds. They can be revoked one by one (revoke_token) or
+all the tokens of a user issued so far (revoke_user_tokens, called by User.save() when the
+password, is_active, user_type or another claimed field changes); revocations are kept in the
+Django cache (AUTH_TOKEN_CACHE_ALIAS), which must be a shared backend for every worker to see them.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from rest_framework import authentication, exceptions
+
+from .models import User
+
+TOKEN_SALT = 'users.authentication.token'
+KEYWORD = 'Bearer'
+REVOKED_TOKEN_PREFIX = 'auth-revoked-token'
+REVOKED_USER_PREFIX = 'auth-revoked-user'
+
+
+def get_ttl():
+    return getattr(settings, 'AUTH_TOKEN_TTL', 60 * 60)
+
+
+def get_revocation_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+class PrincipalCache:
+    """ Thread-safe LRU mapping token -> (user, claims) """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is not None:
+                self.entries.move_to_end(token)
+            return entry
+
+    def put(self, token, entry):
+        with self.lock:
+            self.entries[token] = entry
+            self.entries.move_to_end(token)
+            while len(self.entries) > getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 4096):
+                self.entries.popitem(last=False)
+
+    def discard(self, token):
+        with self.lock:
+            self.entries.pop(token, None)
+
+
+principals = PrincipalCache()
+
+
+def issue_token(user):
+    """ Return a signed token for user """
+    claims = {
+        'uid': user.pk,
+        'eml': user.email,
+        'typ': user.user_type,
+        'stf': user.is_staff,
+        'su': user.is_superuser,
+        'iat': time.time(),
+        'jti': secrets.token_urlsafe(9),
+    }
+    return signing.dumps(claims, salt=TOKEN_SALT, compress=True)
+
+
+def _principal(claims):
+    """ Build the user from the token claims without touching the database """
+    user = User(
+        pk=claims['uid'],
+        email=claims['eml'],
+        user_type=claims['typ'],
+        is_staff=claims['stf'],
+        is_superuser=claims['su'],
+        is_active=True,
+    )
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def _is_revoked(claims):
+    revoked = get_revocation_cache().get_many([
+        f"{REVOKED_TOKEN_PREFIX}:{claims['jti']}",
+        f"{REVOKED_USER_PREFIX}:{claims['uid']}",
+    ])
+    if f"{REVOKED_TOKEN_PREFIX}:{claims['jti']}" in revoked:
+        return True
+    revoked_before = revoked.get(f"{REVOKED_USER_PREFIX}:{claims['uid']}")
+    return revoked_before is not None and claims['iat'] <= revoked_before
+
+
+def resolve_token(token):
+    """ Return the user the token was issued for, or None if it is invalid, expired or revoked """
+    entry = principals.get(token)
+    if entry is None:
+        try:
+            claims = signing.loads(token, salt=TOKEN_SALT, max_age=get_ttl())
+        except signing.BadSignature:
+            return None
+        entry = (_principal(claims), claims)
+        principals.put(token, entry)
+    user, claims = entry
+    if time.time() > claims['iat'] + get_ttl() or _is_revoked(claims):
+        principals.discard(token)
+        return None
+    return user
+
+
+def revoke_token(token):
+    """ Revoke a single token """
+    try:
+        claims = signing.loads(token, salt=TOKEN_SALT, max_age=get_ttl())
+    except signing.BadSignature:
+        return
+    # Kept as long as the token could still be valid
+    get_revocation_cache().set(f"{REVOKED_TOKEN_PREFIX}:{claims['jti']}", True, get_ttl())
+    principals.discard(token)
+
+
+def revoke_user_tokens(user):
+    """
+    Revoke every token issued to user until now. Called by User.save() after a password change
+    or a change of the fields the tokens carry (deactivation, user_type...), and on deletion.
+    """
+    get_revocation_cache().set(f'{REVOKED_USER_PREFIX}:{user.pk}', time.time(), get_ttl())
+
+
+def get_bearer_token(auth_header):
+    """ Return the token of an "Authorization: Bearer <token>" header value, None for other schemes """
+    parts = auth_header.split()
+    if not parts or parts[0].lower() != KEYWORD.lower():
+        return None
+    if len(parts) != 2:
+        raise exceptions.AuthenticationFailed("Invalid token header.")
+    return parts[1]
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """ DRF authentication class for the signed bearer tokens """
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).decode('latin-1')
+        token = get_bearer_token(header)
+        if token is None:
+            return None
+        user = resolve_token(token)
+        if user is None:
+            raise exceptions.AuthenticationFailed("Invalid, expired or revoked token.")
+        return user, token
+
+    def authenticate_header(self, request):
+        return KEYWORD
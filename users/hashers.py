@@ -0,0 +1,97 @@
+"""
+Password hashing.
+
+The hasher classes are Django's, with work factors read from settings so they can be tuned
+without code changes:
+
+  PASSWORD_PBKDF2_ITERATIONS                        PBKDF2PasswordHasher
+  PASSWORD_SCRYPT_WORK_FACTOR                       ScryptPasswordHasher
+  PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST   Argon2PasswordHasher (needs argon2-cffi)
+
+The algorithm used for new hashes is the first entry of PASSWORD_HASHERS (see the
+PASSWORD_HASHING_ALGORITHM setting). Hashes made with another algorithm or work factor are
+upgraded transparently the next time the user logs in.
+
+Hashing and verification run in a bounded thread pool (PASSWORD_HASHING_WORKERS threads, at
+most PASSWORD_HASHING_MAX_PENDING jobs queued): the hash functions release the GIL, so this caps
+the CPU spent on hashing per process and keeps it off the event loop for async callers.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * r * N bytes, OpenSSL refuses more than 32MB unless told otherwise
+        return 256 * self.block_size * self.work_factor
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_TIME_COST', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'PASSWORD_ARGON2_MEMORY_COST', hashers.Argon2PasswordHasher.memory_cost)
+
+
+_executor = None
+_pending = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _pending
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', 4)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            _pending = threading.BoundedSemaphore(getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', workers * 8))
+    return _executor, _pending
+
+
+def _submit(func, *args):
+    """ Run func in the hashing pool, blocking the caller while the pool is saturated """
+    executor, pending = _get_executor()
+    pending.acquire()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        pending.release()
+        raise
+    future.add_done_callback(lambda _: pending.release())
+    return future
+
+
+def make_password(password):
+    return _submit(hashers.make_password, password).result()
+
+
+def verify_password(password, encoded):
+    """ Return (is_correct, must_update) like django.contrib.auth.hashers.verify_password """
+    return _submit(hashers.verify_password, password, encoded).result()
+
+
+async def amake_password(password):
+    return await asyncio.wrap_future(await asyncio.to_thread(_submit, hashers.make_password, password))
+
+
+async def averify_password(password, encoded):
+    return await asyncio.wrap_future(await asyncio.to_thread(_submit, hashers.verify_password, password, encoded))
@@ -0,0 +1,35 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import DEFAULT_BATCH_SIZE, provision
+
+
+class Command(BaseCommand):
+    help = "Create users and their initial wallet from a JSON (list of objects) or CSV (email,password,user_type) file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File with the users to create")
+        parser.add_argument('--format', choices=['json', 'csv'], help="File format, guessed from the extension by default")
+        parser.add_argument('--workers', type=int, help="Password hashing processes (default: number of CPUs, 0 to hash in this process)")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--output', help="Write the per user results (wallet tokens, errors) as JSON to this file")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'json')
+        try:
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f)) if file_format == 'csv' else json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        if not isinstance(rows, list):
+            raise CommandError("The JSON file must contain a list of users")
+
+        results = provision(rows, workers=options['workers'], batch_size=options['batch_size'])
+        created = sum(1 for result in results if result['status'] == 'success')
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        self.stdout.write(f"Created {created} users, {len(results) - created} failed")
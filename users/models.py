@@ -9,6 +9,8 @@ Merchant: must be able to register for the service, create a wallet account, cha
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
+from . import hashers
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -43,9 +45,80 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [
+            # Listings of the wallets of one kind of user (e.g. every client wallet) filter on it
+            models.Index(fields=['user_type'], name='user_type'),
+        ]
+
     def __str__(self):
         return self.email
 
+    # Fields carried by signed bearer tokens (users.authentication): tokens issued before any of
+    # them, or the password, changes are revoked on save
+    TOKEN_FIELDS = ('is_active', 'user_type', 'is_staff', 'is_superuser', 'email')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._token_state = user._loaded_token_state()
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Also called by Django to load a deferred field on first access
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        state = self._loaded_token_state()
+        if fields is not None:
+            state = {field: value for field, value in state.items() if field in fields}
+        self._token_state = {**getattr(self, '_token_state', {}), **state}
+
+    def _loaded_token_state(self):
+        """ The loaded token fields; read from __dict__ as accessing a deferred field would query it """
+        return {field: self.__dict__[field] for field in self.TOKEN_FIELDS if field in self.__dict__}
+
+    def _token_fields_changed(self):
+        state = getattr(self, '_token_state', None)
+        if state is None:
+            return False
+        # A field set without having been loaded (deferred) can't be compared, assume it changed
+        return any(field not in state or state[field] != value for field, value in self._loaded_token_state().items())
+
+    def save(self, *args, **kwargs):
+        # _password is only set by set_password(), not by hash upgrades made at login
+        revoke = not self._state.adding and (self._password is not None or self._token_fields_changed())
+        super().save(*args, **kwargs)
+        self._token_state = self._loaded_token_state()
+        if revoke:
+            # Imported here because users.authentication imports this module
+            from .authentication import revoke_user_tokens
+            revoke_user_tokens(self)
+
+    def delete(self, *args, **kwargs):
+        from .authentication import revoke_user_tokens
+        revoke_user_tokens(self)
+        return super().delete(*args, **kwargs)
+
+    # Password hashing runs in the bounded pool of users.hashers, outdated hashes are upgraded on login
+    def set_password(self, raw_password):
+        self.password = hashers.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct, must_update = hashers.verify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes
+            self._password = None
+            self.save(update_fields=['password'])
+        return is_correct
+
+    async def acheck_password(self, raw_password):
+        is_correct, must_update = await hashers.averify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.password = await hashers.amake_password(raw_password)
+            await self.asave(update_fields=['password'])
+        return is_correct
+
     def has_perm(self, perm, obj=None):
         return self.is_superuser
 
@@ -0,0 +1,94 @@
+"""
+Bulk creation of users together with their initial wallet.
+
+Used by the bulk registration endpoint and the provisionusers management command.
+Rows are validated in Python, passwords are hashed in a process pool (hashing dominates the
+cost of creating a user) and users and wallets are inserted with bulk_create, one database
+transaction per batch.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from wallets.models import Wallet
+from .models import User
+from .serializers import BulkUserRegistrationItemSerializer
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _init_worker(settings_module):
+    """ Make Django usable in pool workers started with the spawn method """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_all(passwords, pool, workers):
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    # A few chunks per worker keeps them all busy without paying IPC per password
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _provision_batch(rows, pool, workers, seen):
+    """ Validate, hash and insert one batch of rows, returns one result per row """
+    results = [None] * len(rows)
+    valid = []
+    for index, row in enumerate(rows):
+        serializer = BulkUserRegistrationItemSerializer(data=row)
+        if not serializer.is_valid():
+            results[index] = {'email': row.get('email') if isinstance(row, dict) else None, 'status': 'failed', 'errors': serializer.errors}
+            continue
+        data = serializer.validated_data
+        email = User.objects.normalize_email(data['email'])
+        if email in seen:
+            results[index] = {'email': email, 'status': 'failed', 'errors': {'email': ["Duplicated email in the request."]}}
+            continue
+        seen.add(email)
+        valid.append((index, email, data))
+
+    existing = set(User.objects.filter(email__in=[email for _, email, _ in valid]).values_list('email', flat=True))
+    new = []
+    for index, email, data in valid:
+        if email in existing:
+            results[index] = {'email': email, 'status': 'failed', 'errors': {'email': ["user with this email already exists."]}}
+        else:
+            new.append((index, email, data))
+
+    hashes = _hash_all([data['password'] for _, _, data in new], pool, workers)
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(email=email, user_type=data['user_type'], password=password)
+            for (_, email, data), password in zip(new, hashes)
+        ])
+        wallets = Wallet.objects.bulk_create([Wallet(user=user, is_merchant=user.user_type == 'merchant') for user in users])
+    for (index, email, data), wallet in zip(new, wallets):
+        results[index] = {'email': email, 'user_type': data['user_type'], 'status': 'success', 'wallet': str(wallet.token)}
+    return results
+
+
+def provision(rows, workers=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create a user and an initial wallet for every row ({email, password, user_type}).
+    Returns one result per row, in order, with the wallet token or the validation errors.
+    workers=0 hashes in the current process.
+    """
+    rows = list(rows)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers > 0 and len(rows) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'wallet_service.settings'),))
+    seen = set()
+    results = []
+    try:
+        for start in range(0, len(rows), batch_size):
+            results += _provision_batch(rows[start:start + batch_size], pool, workers, seen)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
@@ -1,4 +1,4 @@
-from django.contrib.auth import get_user_model
+from django.contrib.auth import authenticate, get_user_model
 from rest_framework import serializers
 User = get_user_model()
 
@@ -10,10 +10,29 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        user = User.objects.create(
+        user = User(
             email=validated_data['email'],
             user_type=validated_data['user_type']
         )
+        # Hash before the first save so the user is written with a single INSERT
         user.set_password(validated_data['password'])
         user.save()
-        return user
\ No newline at end of file
+        return user
+
+class BulkUserRegistrationItemSerializer(serializers.Serializer):
+    """ One user of a bulk registration, email uniqueness is checked for the whole batch at once """
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(write_only=True)
+    user_type = serializers.ChoiceField(choices=User.USER_TYPES, default='client')
+
+class TokenObtainSerializer(serializers.Serializer):
+    """ Exchange email and password for a signed bearer token """
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True)
+
+    def validate(self, data):
+        user = authenticate(self.context.get('request'), email=data['email'], password=data['password'])
+        if user is None:
+            raise serializers.ValidationError("Unable to log in with provided credentials.")
+        data['user'] = user
+        return data
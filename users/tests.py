@@ -1,3 +1,208 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from wallets.models import Wallet
+from . import hashers
+from .authentication import issue_token
+from .models import User
+from .provisioning import provision
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(TestCase):
+
+    def rows(self):
+        return [
+            {'email': 'a@example.com', 'password': 'secret-a', 'user_type': 'client'},
+            {'email': 'm@example.com', 'password': 'secret-m', 'user_type': 'merchant'},
+            {'email': 'a@EXAMPLE.com', 'password': 'again', 'user_type': 'client'},
+            {'email': 'taken@example.com', 'password': 'secret', 'user_type': 'client'},
+            {'email': 'not an email', 'password': 'secret'},
+        ]
+
+    def setUp(self):
+        User.objects.create(email='taken@example.com')
+
+    def test_provision(self):
+        results = provision(self.rows(), workers=0, batch_size=2)
+        self.assertEqual([result['status'] for result in results], ['success', 'success', 'failed', 'failed', 'failed'])
+        self.assertEqual(results[2]['errors'], {'email': ["Duplicated email in the request."]})
+        self.assertEqual(results[3]['errors'], {'email': ["user with this email already exists."]})
+        self.assertIn('email', results[4]['errors'])
+
+        merchant = User.objects.get(email='m@example.com')
+        self.assertEqual(merchant.user_type, 'merchant')
+        self.assertTrue(check_password('secret-m', merchant.password))
+        wallet = Wallet.objects.get(user=merchant)
+        self.assertEqual(str(wallet.token), results[1]['wallet'])
+        self.assertTrue(wallet.is_merchant)
+        self.assertEqual(Wallet.objects.filter(user__email='a@example.com', is_merchant=False).count(), 1)
+
+    def test_provision_with_a_process_pool(self):
+        results = provision(self.rows()[:2], workers=2)
+        self.assertEqual([result['status'] for result in results], ['success', 'success'])
+        self.assertTrue(check_password('secret-a', User.objects.get(email='a@example.com').password))
+
+    def test_bulk_registration_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(email='staff@example.com', is_staff=True))
+        # No process pool is started per request by default
+        with mock.patch('users.provisioning.ProcessPoolExecutor') as pool:
+            response = client.post('/users/register/bulk/', {'users': self.rows()}, format='json')
+        pool.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['success', 'success', 'failed', 'failed', 'failed'])
+        self.assertEqual(client.post('/users/register/bulk/', [], format='json').status_code, 400)
+
+        client.force_authenticate(User.objects.get(email='a@example.com'))
+        self.assertEqual(client.post('/users/register/bulk/', self.rows(), format='json').status_code, 403)
+
+    def test_provisionusers_command(self):
+        stdout = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            source, output = os.path.join(directory, 'users.csv'), os.path.join(directory, 'results.json')
+            with open(source, 'w', newline='') as f:
+                f.write('email,password,user_type\r\nc@example.com,secret,client\r\ntaken@example.com,secret,client\r\n')
+            call_command('provisionusers', source, '--workers', '0', '--output', output, stdout=stdout)
+            with open(output) as f:
+                self.assertEqual([result['status'] for result in json.load(f)], ['success', 'failed'])
+        self.assertEqual(stdout.getvalue(), "Created 1 users, 1 failed\n")
+        self.assertTrue(Wallet.objects.filter(user__email='c@example.com').exists())
+
+
+@override_settings(
+    PASSWORD_HASHERS=['users.hashers.PBKDF2PasswordHasher', 'users.hashers.ScryptPasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'],
+    PASSWORD_PBKDF2_ITERATIONS=1000,
+    PASSWORD_SCRYPT_WORK_FACTOR=2 ** 10,
+)
+class PasswordHashingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='client@example.com', password=make_password('secret', hasher='md5'))
+
+    def login(self, password='secret'):
+        return APIClient().post('/users/token/', {'email': self.user.email, 'password': password}, format='json')
+
+    def test_work_factors_come_from_settings(self):
+        self.assertTrue(hashers.make_password('secret').startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(make_password('secret', hasher='scrypt').startswith('scrypt$'))
+        self.assertIn('$1024$', make_password('secret', hasher='scrypt'))
+        self.assertEqual(hashers.verify_password('secret', make_password('secret', hasher='scrypt')), (True, True))
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        self.assertEqual(self.login('wrong').status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(PASSWORD_PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    async def test_async_check_upgrades(self):
+        self.assertFalse(await self.user.acheck_password('wrong'))
+        self.assertTrue(await self.user.acheck_password('secret'))
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TokenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='client@example.com', password='secret', user_type='client')
+        Wallet.objects.create(user=self.user)
+
+    def obtain(self, password='secret'):
+        return APIClient().post('/users/token/', {'email': self.user.email, 'password': password}, format='json')
+
+    def get(self, token):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client.get('/wallets/transactions/')
+
+    def test_obtain_and_use(self):
+        response = self.obtain()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['expires_in'], 60 * 60)
+        self.assertEqual(self.get(response.json()['token']).status_code, 200)
+
+        self.assertEqual(self.obtain('wrong').status_code, 400)
+        self.assertEqual(self.get(response.json()['token'] + 'x').status_code, 401)
+
+    def test_revoke(self):
+        token = self.obtain().json()['token']
+        other = issue_token(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.post('/users/token/revoke/').status_code, 204)
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.get(other).status_code, 200)
+
+    def test_account_changes_revoke_tokens(self):
+        changes = {
+            'deactivation': lambda user: setattr(user, 'is_active', False),
+            'password change': lambda user: user.set_password('changed'),
+            'user type change': lambda user: setattr(user, 'user_type', 'merchant'),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                user = User.objects.get(pk=self.user.pk)
+                token = issue_token(user)
+                self.assertEqual(self.get(token).status_code, 200)
+                change(user)
+                user.save()
+                self.assertEqual(self.get(token).status_code, 401)
+                User.objects.filter(pk=user.pk).update(is_active=True, user_type='client')
+
+        user = User.objects.get(pk=self.user.pk)
+        token = issue_token(user)
+        user.save()
+        self.assertEqual(self.get(token).status_code, 200)
+
+    @override_settings(AUTH_TOKEN_TTL=-1)
+    def test_expired_token(self):
+        self.assertEqual(self.get(issue_token(self.user)).status_code, 401)
+
+    def test_hash_upgrades_keep_tokens(self):
+        token = issue_token(self.user)
+        with self.settings(PASSWORD_HASHERS=['users.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'], PASSWORD_PBKDF2_ITERATIONS=1000):
+            self.assertEqual(self.obtain().status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.get(token).status_code, 200)
+
+    def test_deferred_loads(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.refresh_from_db(fields=['email'])
+        self.assertEqual(User.objects.only('id').get(pk=self.user.pk).email, self.user.email)
+        self.assertEqual([user.email for user in User.objects.only('email')], [self.user.email])
+
+        token = issue_token(self.user)
+        user = User.objects.only('id').get(pk=self.user.pk)
+        user.save()
+        self.assertEqual(self.get(token).status_code, 200)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.get(token).status_code, 401)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        token = issue_token(self.user)
+        user = User.objects.only('email').get(pk=self.user.pk)
+        self.assertTrue(user.is_active)
+        user.user_type = 'merchant'
+        user.save()
+        self.assertEqual(self.get(token).status_code, 401)
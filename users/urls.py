@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import ClientRegistrationView, MerchantRegistrationView
+from .views import ClientRegistrationView, MerchantRegistrationView, BulkRegistrationView, ObtainTokenView, RevokeTokenView
 
 urlpatterns = [
     path('register/client/', ClientRegistrationView.as_view(), name='client-registration'),
     path('register/merchant/', MerchantRegistrationView.as_view(), name='merchant-registration'),
+    path('register/bulk/', BulkRegistrationView.as_view(), name='bulk-registration'),
+    path('token/', ObtainTokenView.as_view(), name='token-obtain'),
+    path('token/revoke/', RevokeTokenView.as_view(), name='token-revoke'),
 ]
\ No newline at end of file
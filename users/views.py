@@ -1,12 +1,21 @@
 from django.shortcuts import render
 
-from rest_framework import generics
+from django.conf import settings
+from rest_framework import generics, status
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import User
-from .serializers import UserRegistrationSerializer
+from .authentication import SignedTokenAuthentication, get_ttl, issue_token, revoke_token
+from .provisioning import provision
+from .serializers import UserRegistrationSerializer, TokenObtainSerializer
+
+MAX_BULK_REGISTRATION_SIZE = 5000
 
 class ClientRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     queryset = User.objects.none() # Required for DjangoModelPermissions
+    permission_classes = [AllowAny] # Registration is open to anonymous users
 
     def perform_create(self, serializer):
         serializer.save(user_type='client')
@@ -14,6 +23,43 @@ class ClientRegistrationView(generics.CreateAPIView):
 class MerchantRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
     queryset = User.objects.none() 
+    permission_classes = [AllowAny]
 
     def perform_create(self, serializer):
         serializer.save(user_type='merchant')
+
+class BulkRegistrationView(APIView):
+    """
+    Register many users at once, each with an initial wallet (staff only).
+    Accepts a list of {email, password, user_type}; larger imports should use the provisionusers command.
+    Passwords are hashed in the request's process unless BULK_REGISTRATION_WORKERS is set.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        rows = request.data if isinstance(request.data, list) else request.data.get('users')
+        if not isinstance(rows, list) or not rows:
+            return Response({"message": "Expected a non-empty list of users"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_BULK_REGISTRATION_SIZE:
+            return Response({"message": f"At most {MAX_BULK_REGISTRATION_SIZE} users per request"}, status=status.HTTP_400_BAD_REQUEST)
+        results = provision(rows, workers=settings.BULK_REGISTRATION_WORKERS)
+        return Response({'results': results}, status=status.HTTP_201_CREATED)
+
+class ObtainTokenView(APIView):
+    """ Return a signed bearer token for the given email and password """
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        serializer = TokenObtainSerializer(data=request.data, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'token': issue_token(serializer.validated_data['user']), 'expires_in': get_ttl()})
+
+class RevokeTokenView(APIView):
+    """ Revoke the bearer token used to authenticate this request """
+    authentication_classes = [SignedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,31 @@
+"""
+Database connection setup.
+
+configure_sqlite applies the SQLITE_PRAGMAS setting to every new SQLite connection. It is
+connected to the connection_created signal by the wallets app. Pragmas persisted in the
+database file are skipped for SQLITE_TRACKED_DATABASE, the development database under version
+control.
+"""
+
+from pathlib import Path
+
+from django.conf import settings
+
+# Written to the database file header instead of lasting for the connection only
+PERSISTENT_PRAGMAS = {'journal_mode'}
+
+
+def _is_tracked(name):
+    tracked = getattr(settings, 'SQLITE_TRACKED_DATABASE', None)
+    return tracked is not None and Path(str(name)).resolve() == Path(tracked).resolve()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    tracked = _is_tracked(connection.settings_dict['NAME'])
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if tracked and pragma in PERSISTENT_PRAGMAS:
+                continue
+            cursor.execute(f'PRAGMA {pragma} = {value}')
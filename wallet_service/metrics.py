@@ -0,0 +1,159 @@
+"""
+Per-request latency and database instrumentation.
+
+MetricsMiddleware records, for every resolved view (e.g. "WalletViewSet.charge",
+"TransactionViewSet.list"), the wall time, the number of ORM queries and the time spent in SQL.
+It also flags likely N+1 patterns: the same SQL statement executed METRICS_N_PLUS_ONE_THRESHOLD
+times or more within one request, and counts the requests admitted and rejected by the
+rate limiting buckets (wallets.throttling). The numbers are aggregated in in-process histograms and
+exposed in the Prometheus text format by metrics_view (mounted at /metrics).
+
+Each worker process keeps its own numbers, scrape every worker (or aggregate them upstream).
+Queries made by async views run on another thread and are not counted.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def get_n_plus_one_threshold():
+    return getattr(settings, 'METRICS_N_PLUS_ONE_THRESHOLD', 5)
+
+
+class Histogram:
+    """ Cumulative histogram with fixed buckets, one series per view label """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = defaultdict(lambda: {'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0})
+
+    def observe(self, label, value):
+        series = self.series[label]
+        series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {series["count"]}')
+        return lines
+
+
+class Registry:
+    """ All the metrics of this process """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.duration = Histogram('wallet_request_duration_seconds', 'Wall time of the request.', DURATION_BUCKETS)
+        self.queries = Histogram('wallet_request_queries', 'Database queries run by the request.', QUERY_BUCKETS)
+        self.sql_time = Histogram('wallet_request_sql_seconds', 'Time spent executing SQL in the request.', DURATION_BUCKETS)
+        self.n_plus_one = Counter()
+        self.throttle = Counter()
+
+    def record(self, label, duration, queries, sql_time, n_plus_one):
+        with self.lock:
+            self.duration.observe(label, duration)
+            self.queries.observe(label, queries)
+            self.sql_time.observe(label, sql_time)
+            if n_plus_one:
+                self.n_plus_one[label] += 1
+
+    def record_throttle(self, scope, allowed):
+        with self.lock:
+            self.throttle[scope, 'allowed' if allowed else 'throttled'] += 1
+
+    def render(self):
+        with self.lock:
+            lines = self.duration.render() + self.queries.render() + self.sql_time.render()
+            lines += ['# HELP wallet_n_plus_one_total Requests that repeated the same SQL statement suspiciously often.',
+                      '# TYPE wallet_n_plus_one_total counter']
+            lines += [f'wallet_n_plus_one_total{{view="{label}"}} {count}' for label, count in sorted(self.n_plus_one.items())]
+            lines += ['# HELP wallet_throttle_decisions_total Rate limiting bucket decisions.',
+                      '# TYPE wallet_throttle_decisions_total counter']
+            lines += [f'wallet_throttle_decisions_total{{scope="{scope}",decision="{decision}"}} {count}'
+                      for (scope, decision), count in sorted(self.throttle.items())]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """ Database execute wrapper counting queries, SQL time and repeated statements """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+def view_label(view_func, method):
+    """ "ViewClass.action" for DRF viewsets, the view class or function name otherwise """
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', 'unknown')
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{view_class.__name__}.{action}' if action else view_class.__name__
+
+
+class MetricsMiddleware:
+    """ Records latency and database usage of every request into the metrics registry """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        label = getattr(request, '_metrics_view', None)
+        if label is None or label == 'metrics_view':
+            return response
+        repeated = [sql for sql, count in recorder.statements.items() if count >= get_n_plus_one_threshold()]
+        if repeated:
+            logger.warning("Possible N+1 in %s: %s executed %d times", label, repeated[0], recorder.statements[repeated[0]])
+        registry.record(label, duration, recorder.count, recorder.time, bool(repeated))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_label(view_func, request.method)
+
+
+def metrics_view(request):
+    """ Prometheus text exposition of the metrics registry """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,85 @@
+"""
+Read-replica routing.
+
+Requests with a safe method (GET, HEAD, OPTIONS) read from one of the replica aliases
+(DATABASE_REPLICAS) while everything else uses the primary ('default'):
+  * every write, and every read made inside a transaction.atomic() block, goes to the primary;
+  * once a request has written, its remaining reads go to the primary too;
+  * a response to a request that wrote sets a short-lived cookie (REPLICA_PIN_SECONDS) which
+    pins that client's next requests to the primary, so users see their own writes despite the
+    replication lag.
+Code running outside a request (management commands, workers) always uses the primary.
+"""
+
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'replica_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = contextvars.ContextVar('replica_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """ Send the reads made in the block to the primary, e.g. to fill a cache with fresh data """
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """ Sends reads of replica-eligible requests to a replica, everything else to the primary """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state['replica'] or state['wrote'] or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state['replica']
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """ Chooses the database of each request's reads, see the module docstring """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = get_replicas()
+        use_replica = replicas and request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        state = {'replica': random.choice(replicas) if use_replica else None, 'wrote': False}
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state['wrote'] and replicas:
+            response.set_cookie(PIN_COOKIE, '1', max_age=get_pin_seconds(), httponly=True, samesite='Lax')
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -22,8 +23,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-9c^9c*yr%ll^4^9n!l*k7w^!sc85(*go=#e0r2a7%3nu1r8993'
 
+# Database profile, 'sqlite' (default, local development) or 'postgresql' (production)
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'sqlite')
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# With DEBUG on, Django also keeps every executed query in memory.
+DEBUG = os.environ.get('DJANGO_DEBUG', '1' if DATABASE_PROFILE == 'sqlite' else '0').lower() in ('1', 'true', 'yes')
 
 ALLOWED_HOSTS = []
 
@@ -45,6 +50,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'wallet_service.metrics.MetricsMiddleware',
+    'wallet_service.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,10 +67,25 @@ REST_FRAMEWORK = {
     # or allow read-only access for unauthenticated users.
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-    ]
+    ],
+    # Signed bearer tokens first: they are resolved without any database query
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
 }
+
+# Bearer tokens: lifetime in seconds, principals kept in memory per process,
+# cache alias holding revocations (must be shared between workers)
+AUTH_TOKEN_TTL = 60 * 60
+AUTH_TOKEN_CACHE_SIZE = 4096
+AUTH_TOKEN_CACHE_ALIAS = 'default'
 APPEND_SLASH=True
-DEBUG = True
+
+# How long (in seconds) a stored Idempotency-Key response can be replayed
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -85,14 +107,159 @@ WSGI_APPLICATION = 'wallet_service.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+# DATABASE_PROFILE selects the configuration, the connection details come from the environment.
 
-DATABASES = {
-    'default': {
+_DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # Seconds a connection waits for the write lock before "database is locked"
+            'timeout': 20,
+            # Take the write lock when the transaction starts: a deferred transaction that reads
+            # first fails at once on its first write when another writer got in meanwhile
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'wallet_service'),
+        'USER': os.environ.get('POSTGRES_USER', 'wallet_service'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # Persistent connections, checked before reuse so a dropped one is replaced transparently
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    },
+}
+DATABASES = {'default': _DATABASE_PROFILES[DATABASE_PROFILE]}
+
+if DATABASE_PROFILE == 'postgresql':
+    _postgres = DATABASES['default']
+    if os.environ.get('POSTGRES_POOL_MAX_SIZE'):
+        # psycopg 3 connection pool (Django >= 5.1, needs psycopg[pool]); replaces persistent connections
+        _postgres['CONN_MAX_AGE'] = 0
+        _postgres['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ['POSTGRES_POOL_MAX_SIZE']),
+            'timeout': 10,
+        }
+    if os.environ.get('POSTGRES_PGBOUNCER', '').lower() in ('1', 'true', 'yes'):
+        # Transaction pooling hands every transaction a different server connection,
+        # named cursors (used by QuerySet.iterator()) cannot survive that
+        _postgres['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Read replicas: DATABASE_REPLICA_NAMES lists replica databases (SQLite files for the sqlite
+# profile, hosts for the postgresql one), they become the replica1, replica2... aliases.
+# Safe-method requests read from them, see wallet_service.routers.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_NAMES', '').split(',')), start=1):
+    _replica = dict(DATABASES['default'], OPTIONS=dict(DATABASES['default']['OPTIONS']), TEST={'MIRROR': 'default'})
+    _replica['NAME' if DATABASE_PROFILE == 'sqlite' else 'HOST'] = _name.strip()
+    DATABASES[f'replica{_index}'] = _replica
+    DATABASE_REPLICAS.append(f'replica{_index}')
+DATABASE_ROUTERS = ['wallet_service.routers.ReplicaRouter']
+
+# Seconds a client reads from the primary after a request of theirs wrote
+REPLICA_PIN_SECONDS = 5
+
+# PRAGMAs applied to every new SQLite connection (see wallets.apps): WAL lets readers run
+# alongside the single writer, NORMAL sync is durable across application crashes in WAL mode.
+# Set SQLITE_TUNING=0 to get SQLite's defaults back.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000, # milliseconds
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+} if os.environ.get('SQLITE_TUNING', '1').lower() in ('1', 'true', 'yes') else {}
+# The development database committed to the repository: pragmas stored in the file itself
+# (journal_mode) are not applied to it, so running the project leaves the checkout clean.
+# Point SQLITE_PATH elsewhere to get WAL.
+SQLITE_TRACKED_DATABASE = BASE_DIR / 'db.sqlite3'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Cache alias and TTL (in seconds) used for wallet status lookups
+WALLET_CACHE_ALIAS = 'default'
+WALLET_CACHE_TTL = 30
+
+# TTL (in seconds) of cached merchant analytics results
+ANALYTICS_CACHE_TTL = 60
+
+# Executing the same SQL this many times in one request is reported as a possible N+1
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# Rate limiting of charges and recharges (see wallets.throttling): a bucket per user, sized by
+# user_type, and one per target wallet; burst requests at once, refilled at rate per second
+TOKEN_BUCKET_RATES = {
+    'merchant': {'burst': 100, 'rate': 50},
+    'client': {'burst': 20, 'rate': 5},
+    'wallet': {'burst': 20, 'rate': 10},
+}
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Transactions older than this many days are moved to the archive tier by archivetransactions
+TRANSACTION_ARCHIVE_AFTER_DAYS = 365
+
+# Write-behind recharges: when enabled, recharges are queued and answered with 202, the
+# processrecharges worker applies them in batches of RECHARGE_QUEUE_BATCH_SIZE
+RECHARGE_WRITE_BEHIND = os.environ.get('RECHARGE_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+RECHARGE_QUEUE_BATCH_SIZE = 500
+
+# Balance change events streamed by /wallets/async/events/ (see wallets.events). LocalBackend only
+# reaches subscribers of the publishing process, use wallets.events.RedisBackend (with
+# WALLET_EVENTS_REDIS_URL) when running several workers. Slow subscribers are told to resync after
+# WALLET_EVENTS_QUEUE_SIZE pending events, idle streams get a comment every WALLET_EVENTS_HEARTBEAT seconds.
+WALLET_EVENTS_BACKEND = os.environ.get('WALLET_EVENTS_BACKEND', 'wallets.events.LocalBackend')
+WALLET_EVENTS_REDIS_URL = os.environ.get('WALLET_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+WALLET_EVENTS_QUEUE_SIZE = 100
+WALLET_EVENTS_HEARTBEAT = 15
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+# New passwords are hashed with PASSWORD_HASHING_ALGORITHM ('pbkdf2', 'scrypt' or 'argon2',
+# the latter needs argon2-cffi). Existing hashes keep working and are upgraded on login.
+
+PASSWORD_HASHING_ALGORITHM = os.environ.get('PASSWORD_HASHING_ALGORITHM', 'pbkdf2')
+
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHING_ALGORITHM]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHING_ALGORITHM
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Work factors, changing them rehashes passwords on the next login
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 1_000_000))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 102400))
+
+# Threads hashing passwords per process, and how many hashes may wait for one
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 4))
+PASSWORD_HASHING_MAX_PENDING = PASSWORD_HASHING_WORKERS * 8
+
+# Processes hashing the passwords of a bulk registration request, 0 hashes in the request's
+# process; large imports should go through the provisionusers command (--workers) instead
+BULK_REGISTRATION_WORKERS = int(os.environ.get('BULK_REGISTRATION_WORKERS', 0))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('wallets/',include('wallets.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('users/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
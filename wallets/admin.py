@@ -1,7 +1,11 @@
 from django.contrib import admin
 
-from .models import Wallet, Transaction
+from .models import Wallet, Transaction, ArchivedTransaction, LedgerEntry, QueuedRecharge, IdempotencyKey
 
 admin.site.register(Wallet)
 admin.site.register(Transaction)
+admin.site.register(ArchivedTransaction)
+admin.site.register(LedgerEntry)
+admin.site.register(QueuedRecharge)
+admin.site.register(IdempotencyKey)
 
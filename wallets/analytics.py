@@ -0,0 +1,52 @@
+"""
+Aggregate analytics over transactions.
+
+All grouping is done by the database (Sum/Count/Avg over Trunc* buckets), only the aggregated
+rows are sent back. Results are cached per user and query window for ANALYTICS_CACHE_TTL seconds.
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+from .cache import get_cache
+
+KEY_PREFIX = 'wallet-analytics'
+TRUNCATIONS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+}
+
+
+def get_ttl():
+    return getattr(settings, 'ANALYTICS_CACHE_TTL', 60)
+
+
+def summarize(queryset, interval):
+    """ Totals over the whole queryset plus a histogram bucketed by interval """
+    totals = queryset.aggregate(count=Count('id'), total=Sum('amount'), average=Avg('amount'))
+    buckets = (
+        queryset.annotate(period=TRUNCATIONS[interval]('created_at'))
+        .values('period')
+        .annotate(count=Count('id'), total=Sum('amount'))
+        .order_by('period')
+    )
+    return {'interval': interval, **totals, 'histogram': list(buckets)}
+
+
+def cached_summary(user, queryset, params):
+    """
+    Cached version of summarize(); params are the validated query parameters that produced
+    queryset and are used, together with the user, as the cache key.
+    """
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    key = f'{KEY_PREFIX}:{user.pk}:{digest}'
+    cache = get_cache()
+    result = cache.get(key)
+    if result is None:
+        result = summarize(queryset, params['interval'])
+        cache.set(key, result, get_ttl())
+    return result
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class WalletsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'wallets'
+
+    def ready(self):
+        from wallet_service.db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='wallet_service.db.configure_sqlite')
@@ -0,0 +1,52 @@
+"""
+Hot/cold tiering of the transaction history.
+
+Transactions older than TRANSACTION_ARCHIVE_AFTER_DAYS are moved, with their ids, from the hot
+Transaction table to ArchivedTransaction by the archivetransactions command. Readers go through
+the TransactionHistory view, which is the union of both tiers, and ledger entries, snapshots
+and statements are left untouched, so archiving changes no API response: it only keeps the hot
+table and its indexes small.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedTransaction, Transaction
+
+DEFAULT_BATCH_SIZE = 5000
+COLUMNS = ('id', 'wallet_id', 'amount', 'transaction_type', 'status', 'created_at')
+
+
+def get_horizon_days():
+    return getattr(settings, 'TRANSACTION_ARCHIVE_AFTER_DAYS', 365)
+
+
+def get_cutoff(days=None):
+    return timezone.now() - timedelta(days=get_horizon_days() if days is None else days)
+
+
+def archive_batch(before, batch_size=DEFAULT_BATCH_SIZE):
+    """ Move up to batch_size transactions created before `before` to the archive, returns how many moved """
+    with transaction.atomic():
+        rows = list(
+            Transaction.objects.filter(created_at__lt=before).order_by('id').values_list(*COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedTransaction.objects.bulk_create([ArchivedTransaction(**dict(zip(COLUMNS, row))) for row in rows])
+        # Copied and deleted in the same transaction, the history view never shows a row twice
+        Transaction.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive(before, batch_size=DEFAULT_BATCH_SIZE):
+    """ Move every transaction created before `before` to the archive, one transaction per batch """
+    total = 0
+    while True:
+        moved = archive_batch(before, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
@@ -0,0 +1,348 @@
+"""
+Async-native variants of the hot wallet endpoints, meant to be served through ASGI
+(wallet_service/asgi.py, e.g. under uvicorn) where they run on the event loop instead of
+being pushed to a worker thread.
+
+Reads use Django's async ORM and cache APIs. Balance mutations still run the sync ledger
+through sync_to_async: transaction.atomic() has no async counterpart yet.
+Idempotency-Key is only honoured by the DRF endpoints in views.py.
+AsyncWalletEventsView streams balance changes (Server-Sent Events) and only exists here: a
+long-lived stream would hold a whole worker thread under WSGI.
+"""
+
+import asyncio
+import base64
+import json
+import math
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.conf import settings
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.authentication import CSRFCheck
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+
+from users.authentication import get_bearer_token, resolve_token
+from . import cache as wallet_cache, events, fast_serializers, ledger, recharge_queue, throttling
+from .models import LedgerEntry, Wallet, TransactionHistory
+from .pagination import TransactionCursorPagination, WalletCursorPagination
+from .serializers import ClientWalletFilterSerializer, LedgerEntrySerializer, QueuedRechargeSerializer, TransactionSerializer, WalletChargeSerializer, WalletRechargeSerializer
+
+NOT_AUTHENTICATED = {"detail": "Authentication credentials were not provided."}
+FORBIDDEN = {"detail": "You do not have permission to perform this action."}
+
+
+async def _authenticate(request, user_type=None):
+    """ Return (user, error response), the response is None when the user may proceed """
+    try:
+        token = get_bearer_token(request.headers.get('Authorization', ''))
+    except AuthenticationFailed as e:
+        return None, JsonResponse({"detail": str(e.detail)}, status=401)
+    if token is not None:
+        user = resolve_token(token)
+        if user is None:
+            return None, JsonResponse({"detail": "Invalid, expired or revoked token."}, status=401)
+    else:
+        user = await request.auser()
+        if user.is_authenticated:
+            csrf_failure = _csrf_failure(request)
+            if csrf_failure:
+                return user, JsonResponse({"detail": f"CSRF Failed: {csrf_failure}"}, status=403)
+    if not user.is_authenticated:
+        return user, JsonResponse(NOT_AUTHENTICATED, status=403)
+    if user_type is not None and user.user_type != user_type:
+        return user, JsonResponse(FORBIDDEN, status=403)
+    return user, None
+
+
+def _csrf_failure(request):
+    """ Reason the CSRF check fails for request, None if it passes (same check as DRF's SessionAuthentication) """
+    check = CSRFCheck(lambda request: None)
+    # Populates request.META['CSRF_COOKIE'], used by process_view()
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+class AsyncView(View):
+    """
+    Base of the views below. Like DRF's APIView they are exempt from CsrfViewMiddleware:
+    bearer token requests carry no cookie to forge, _authenticate enforces CSRF for session ones.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+
+def _throttled(user, token):
+    """ 429 response when the user or the wallet is over its rate limit, None otherwise """
+    wait = throttling.check(user, token)
+    if wait is None:
+        return None
+    response = JsonResponse({"detail": f"Request was throttled. Expected available in {math.ceil(wait)} seconds."}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+def _encode_cursor(moment, pk):
+    return base64.urlsafe_b64encode(f'{moment.isoformat()}|{pk}'.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        moment, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return parse_datetime(moment), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _page_size(request, pagination_class):
+    try:
+        return min(int(request.GET.get('page_size', pagination_class.page_size)), pagination_class.max_page_size)
+    except ValueError:
+        return pagination_class.page_size
+
+
+def _next_url(request, moment, pk):
+    query = request.GET.copy()
+    query['cursor'] = _encode_cursor(moment, pk)
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+class AsyncWalletDetailView(AsyncView):
+    """ Async WalletDetailView """
+
+    async def get(self, request, *args, **kwargs):
+        user, denied = await _authenticate(request)
+        if denied:
+            return denied
+
+        async def load():
+            try:
+                return await Wallet.objects.aget(user=user)
+            except Wallet.DoesNotExist:
+                return None
+
+        entry = await wallet_cache.aget_user_wallet_status(user.pk, loader=load)
+        if entry is None:
+            return JsonResponse({"message": "Wallet not found"}, status=404)
+        return JsonResponse(entry['data'])
+
+
+class AsyncClientWalletsListView(AsyncView):
+    """
+    Async ClientWalletsListView, paginated by keyset on (updated_at, id), most recently active first.
+    The cursor is opaque and returned in "next".
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user, denied = await _authenticate(request, 'merchant')
+        if denied:
+            return denied
+        params = ClientWalletFilterSerializer(data=request.GET)
+        if not params.is_valid():
+            return JsonResponse(params.errors, status=400)
+        page_size = _page_size(request, WalletCursorPagination)
+        wallets = params.filter_queryset(Wallet.objects.filter(user__user_type='client')).order_by('-updated_at', '-id')
+        if 'cursor' in request.GET:
+            position = _decode_cursor(request.GET['cursor'])
+            if position is None:
+                return JsonResponse({"detail": "Invalid cursor"}, status=404)
+            updated_at, pk = position
+            wallets = wallets.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=pk))
+
+        page = [row async for row in wallets.values('id', *fast_serializers.WALLET_STATUS_FIELDS)[:page_size + 1]]
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_url = _next_url(request, page[-1]['updated_at'], page[-1]['id'])
+        return fast_serializers.json_response({'next': next_url, 'previous': None, 'results': fast_serializers.wallet_statuses(page)})
+
+
+class AsyncTransactionListView(AsyncView):
+    """
+    Async TransactionViewSet.list, paginated by keyset on (created_at, id), newest first.
+    The cursor is opaque and returned in "next".
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user, denied = await _authenticate(request)
+        if denied:
+            return denied
+        page_size = _page_size(request, TransactionCursorPagination)
+
+        if user.user_type == 'merchant':
+            # Same as ledger.merchant_entries: the credit legs of the merchant's wallet
+            wallet_ids = [pk async for pk in Wallet.objects.filter(user_id=user.pk).values_list('pk', flat=True)]
+            transactions = LedgerEntry.objects.select_related('transaction__wallet').filter(wallet_id__in=wallet_ids, amount__gt=0)
+            serializer_class = LedgerEntrySerializer
+        else:
+            transactions = TransactionHistory.objects.select_related('wallet').filter(wallet__user=user)
+            serializer_class = TransactionSerializer
+        transactions = transactions.order_by('-created_at', '-id')
+        if 'cursor' in request.GET:
+            position = _decode_cursor(request.GET['cursor'])
+            if position is None:
+                return JsonResponse({"detail": "Invalid cursor"}, status=404)
+            created_at, pk = position
+            transactions = transactions.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        page = [txn async for txn in transactions[:page_size + 1]]
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_url = _next_url(request, page[-1].created_at, page[-1].pk)
+        results = serializer_class(page, many=True).data
+        return JsonResponse({'next': next_url, 'previous': None, 'results': results})
+
+
+def _save(serializer):
+    """ Validate and apply a charge/recharge serializer, returns (data, errors) """
+    if not serializer.is_valid():
+        return None, serializer.errors
+    try:
+        with transaction.atomic():
+            serializer.save()
+    except ValidationError as e:
+        return None, e.detail
+    return serializer.data, None
+
+
+def _enqueue(serializer, user):
+    """ Validate a recharge serializer and queue it for the write-behind worker """
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    return JsonResponse(QueuedRechargeSerializer(serializer.enqueue(user)).data, status=202)
+
+
+class AsyncWalletChargeView(AsyncView):
+    """ Async WalletViewSet.charge """
+
+    async def post(self, request, token):
+        user, denied = await _authenticate(request, 'merchant')
+        if denied:
+            return denied
+        throttled = _throttled(user, token)
+        if throttled:
+            return throttled
+        try:
+            wallet = await Wallet.objects.aget(token=token)
+        except Wallet.DoesNotExist:
+            return JsonResponse({"message": "Wallet not found"}, status=404)
+        data = _json_body(request)
+        if data is None:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+        data, errors = await sync_to_async(_save)(WalletChargeSerializer(data=data, context={'wallet': wallet, 'merchant': user}))
+        if errors:
+            return JsonResponse(errors, status=400)
+        return JsonResponse(data)
+
+
+class AsyncWalletRechargeView(AsyncView):
+    """ Async WalletViewSet.recharge """
+
+    async def post(self, request, token):
+        user, denied = await _authenticate(request, 'client')
+        if denied:
+            return denied
+        data = _json_body(request)
+        if data is None:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+        # The credited wallet is the one of the body token
+        throttled = _throttled(user, throttling.recharged_wallet_token(token, data))
+        if throttled:
+            return throttled
+        try:
+            wallet = await Wallet.objects.aget(token=token, user=user)
+        except Wallet.DoesNotExist:
+            return JsonResponse({"detail": "No Wallet matches the given query."}, status=404)
+        serializer = WalletRechargeSerializer(data=data, context={'wallet': wallet})
+        if recharge_queue.is_enabled():
+            return await sync_to_async(_enqueue)(serializer, user)
+        data, errors = await sync_to_async(_save)(serializer)
+        if errors:
+            return JsonResponse(errors, status=400)
+        return JsonResponse(data)
+
+
+def _sse(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _event_stream(tokens, owned):
+    """
+    SSE frames for the events of tokens, until the client disconnects. The transaction is left
+    out of events of wallets outside owned, unless it credited one of them (a merchant's charge).
+    """
+    subscription = events.subscribe(tokens)
+    heartbeat = getattr(settings, 'WALLET_EVENTS_HEARTBEAT', 15)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is events.RESYNC:
+                yield _sse('resync', {})
+                continue
+            token = event['wallet']
+            # Invalidated before the event was published, so this is the balance after the transaction (or later)
+            entry = await wallet_cache.aget_wallet_status(token, loader=lambda: Wallet.objects.filter(token=token).afirst())
+            visible = token in owned or event.get('credited') in owned
+            data = {'wallet': entry['data'] if entry is not None else None, 'transaction': event['transaction'] if visible else None}
+            yield _sse('transaction', data, event['transaction']['id'])
+    finally:
+        events.hub.unsubscribe(subscription)
+
+
+class AsyncWalletEventsView(AsyncView):
+    """
+    Server-Sent Events stream of balance changes, replacing status polling.
+    Subscribes to the wallets given as wallet=<token> query parameters (the user's own wallets
+    by default; clients may only pick their own, merchants also the wallets they have charged).
+    Every committed transaction is sent as a "transaction" event with the transaction and the
+    wallet's new status; "resync" means events were dropped and the status should be reloaded.
+    Merchants get the status only for the transactions of a client wallet they didn't make.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        user, denied = await _authenticate(request)
+        if denied:
+            return denied
+        try:
+            requested = {str(uuid.UUID(token)) for token in request.GET.getlist('wallet')}
+        except ValueError:
+            return JsonResponse({"wallet": ["Must be a valid UUID."]}, status=400)
+        owned = {str(token) async for token in Wallet.objects.filter(user=user).values_list('token', flat=True)}
+        tokens = owned
+        if requested:
+            tokens = owned & requested
+            if user.user_type == 'merchant' and tokens != requested:
+                charged = await sync_to_async(ledger.merchant_transactions)(user)
+                wallets = Wallet.objects.filter(pk__in=charged.values('wallet_id'), token__in=requested - owned)
+                tokens |= {str(token) async for token in wallets.values_list('token', flat=True)}
+        if not tokens or (requested and tokens != requested):
+            return JsonResponse({"detail": "No Wallet matches the given query."}, status=404)
+        response = StreamingHttpResponse(_event_stream(tokens, owned), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
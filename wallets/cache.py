@@ -0,0 +1,156 @@
+"""
+Read-through cache for wallet status payloads.
+
+Entries are keyed by wallet token and hold the WalletStatusSerializer output together with the
+owner id, so status lookups can be answered (and access checked) without a database query.
+Any Django cache backend can be used (local memory, file based, memcached, redis...): the alias
+and the TTL are read from the WALLET_CACHE_ALIAS and WALLET_CACHE_TTL settings.
+Entries are dropped by the ledger whenever a balance changes. Misses are always loaded from
+the primary database, a lagging read replica would put stale balances back in the cache.
+"""
+
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from wallet_service.routers import use_primary
+
+KEY_PREFIX = 'wallet-status'
+USER_KEY_PREFIX = 'wallet-user'
+MERCHANT_KEY_PREFIX = 'wallet-merchant'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'WALLET_CACHE_ALIAS', 'default')]
+
+
+def get_ttl():
+    return getattr(settings, 'WALLET_CACHE_TTL', 30)
+
+
+def _key(token):
+    return f'{KEY_PREFIX}:{token}'
+
+
+def _user_key(user_id):
+    return f'{USER_KEY_PREFIX}:{user_id}'
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def _entry(wallet):
+    # Imported here because fast_serializers imports the models, which are not ready when this module is
+    from .fast_serializers import wallet_status
+    return {'user_id': wallet.user_id, 'data': wallet_status(wallet)}
+
+
+def get_wallet_status(token, loader):
+    """
+    Return the cached entry for token, calling loader() to fetch the wallet on a miss.
+    Returns None if loader returns None (wallet does not exist); misses are not cached.
+    """
+    cache = get_cache()
+    entry = cache.get(_key(token))
+    if entry is not None:
+        _count('hits')
+        return entry
+    _count('misses')
+    with use_primary():
+        wallet = loader()
+    if wallet is None:
+        return None
+    entry = _entry(wallet)
+    cache.set(_key(token), entry, get_ttl())
+    return entry
+
+
+def get_user_wallet_status(user_id, loader):
+    """
+    Same as get_wallet_status for the wallet owned by user_id.
+    The user -> token mapping is cached next to the status entry.
+    """
+    cache = get_cache()
+    token = cache.get(_user_key(user_id))
+    if token is not None:
+        return get_wallet_status(token, loader)
+    _count('misses')
+    with use_primary():
+        wallet = loader()
+    if wallet is None:
+        return None
+    entry = _entry(wallet)
+    cache.set_many({_user_key(user_id): wallet.token, _key(wallet.token): entry}, get_ttl())
+    return entry
+
+
+async def aget_wallet_status(token, loader):
+    """ Async version of get_wallet_status, loader must be a coroutine function """
+    cache = get_cache()
+    entry = await cache.aget(_key(token))
+    if entry is not None:
+        _count('hits')
+        return entry
+    _count('misses')
+    with use_primary():
+        wallet = await loader()
+    if wallet is None:
+        return None
+    entry = _entry(wallet)
+    await cache.aset(_key(token), entry, get_ttl())
+    return entry
+
+
+async def aget_user_wallet_status(user_id, loader):
+    """ Async version of get_user_wallet_status, loader must be a coroutine function """
+    cache = get_cache()
+    token = await cache.aget(_user_key(user_id))
+    if token is not None:
+        return await aget_wallet_status(token, loader)
+    _count('misses')
+    with use_primary():
+        wallet = await loader()
+    if wallet is None:
+        return None
+    entry = _entry(wallet)
+    await cache.aset_many({_user_key(user_id): wallet.token, _key(wallet.token): entry}, get_ttl())
+    return entry
+
+
+def get_merchant_wallet_ref(user_id):
+    """ Cached (pk, token) of the merchant's wallet, or None """
+    return get_cache().get(f'{MERCHANT_KEY_PREFIX}:{user_id}')
+
+
+def set_merchant_wallet_ref(user_id, wallet):
+    # Merchants have a single wallet which only changes when it is deleted (see invalidate_user)
+    key = f'{MERCHANT_KEY_PREFIX}:{user_id}'
+    ref = (wallet.pk, wallet.token)
+    transaction.on_commit(lambda: get_cache().set(key, ref, None))
+
+
+def invalidate_user(user_id):
+    """ Drop the cached user -> wallet mappings, used when a user gains or loses a wallet """
+    keys = [_user_key(user_id), f'{MERCHANT_KEY_PREFIX}:{user_id}']
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def invalidate(*tokens):
+    """ Drop the cached status of the given wallets once the current transaction commits """
+    keys = [_key(token) for token in tokens]
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def stats():
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
@@ -0,0 +1,54 @@
+"""
+Conditional GET (ETag / Last-Modified) for the wallet and transaction resources.
+
+Validators are computed before the body is built: from the cached wallet status entry for a
+single wallet, from one query for lists (latest updated_at, or the id and created_at of the
+newest of the immutable transactions). A request whose If-None-Match / If-Modified-Since still
+matches gets 304 Not Modified without the body being loaded, serialized or rendered.
+"""
+
+import hashlib
+from datetime import datetime
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *parts):
+    """
+    Strong ETag for a representation identified by parts. The rendering format and the full
+    path (query string included) are part of it, so pages and formats never share a tag.
+    """
+    parts = (request.accepted_renderer.format, request.get_full_path()) + parts
+    return quote_etag(hashlib.blake2b('|'.join(map(str, parts)).encode(), digest_size=16).hexdigest())
+
+
+def wallet_status_validators(request, entry):
+    """ (etag, last_modified) of a cached wallet status entry """
+    updated_at = entry['data']['updated_at']
+    return make_etag(request, entry['data']['token'], updated_at), datetime.fromisoformat(updated_at)
+
+
+def not_modified(request, etag, last_modified):
+    """
+    The 304 (or 412 for a failed If-Match) response when the request's preconditions say so,
+    None when the full response must be sent.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return response and with_validators(response, etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def respond(request, etag, last_modified, build):
+    """ not_modified() if the client's copy is current, else build() with the validators set """
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    return with_validators(build(), etag, last_modified)
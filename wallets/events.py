@@ -0,0 +1,166 @@
+"""
+Balance change events for server-push subscribers.
+
+The ledger publishes an event for every posted transaction, once its database transaction has
+committed, to every wallet whose balance it changed. Events go through the backend named by
+WALLET_EVENTS_BACKEND:
+
+  wallets.events.LocalBackend   delivers to the subscribers of this process only (default,
+                                enough for a single ASGI worker)
+  wallets.events.RedisBackend   publishes on a Redis channel (WALLET_EVENTS_REDIS_URL) that every
+                                process relays to its own subscribers; needs redis-py
+
+Subscribers are the event streams of async_views.AsyncWalletEventsView. Each holds a bounded
+queue (WALLET_EVENTS_QUEUE_SIZE events) on its event loop; a subscriber too slow to keep up
+loses the overflowing events and is told to resynchronise instead of blocking publishers.
+"""
+
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import fast_serializers
+
+RESYNC = object()
+
+
+def get_queue_size():
+    return getattr(settings, 'WALLET_EVENTS_QUEUE_SIZE', 100)
+
+
+class Subscription:
+    """ Events of a set of wallet tokens, read from one event loop """
+
+    def __init__(self, tokens):
+        self.tokens = frozenset(tokens)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(get_queue_size())
+        self.overflowed = False
+
+    def deliver(self, event):
+        """ Called on the subscription's loop """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        """ The next event, RESYNC after events were dropped """
+        if self.overflowed and self.queue.empty():
+            self.overflowed = False
+            return RESYNC
+        return await self.queue.get()
+
+
+class Hub:
+    """ In-process fan-out of events to the subscriptions of their wallet """
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, tokens):
+        subscription = Subscription(tokens)
+        with self.lock:
+            for token in subscription.tokens:
+                self.subscriptions[token].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for token in subscription.tokens:
+                subscribers = self.subscriptions.get(token)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[token]
+
+    def dispatch(self, event):
+        """ Hand event to its subscribers, from any thread """
+        with self.lock:
+            subscribers = list(self.subscriptions.get(event['wallet'], ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop is closed, its stream is gone
+                self.unsubscribe(subscription)
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """ Events stay in this process """
+
+    def publish(self, events):
+        for event in events:
+            hub.dispatch(event)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    """ Events go through a Redis channel so every worker process receives them """
+
+    def __init__(self):
+        import redis
+        self.client = redis.Redis.from_url(settings.WALLET_EVENTS_REDIS_URL)
+        self.channel = getattr(settings, 'WALLET_EVENTS_REDIS_CHANNEL', 'wallet-events')
+        self.listener = None
+        self.lock = threading.Lock()
+
+    def publish(self, events):
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.publish(self.channel, json.dumps(event))
+        pipeline.execute()
+
+    def start(self):
+        """ Relay the channel to the local hub, from a daemon thread started on first use """
+        with self.lock:
+            if self.listener is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: lambda message: hub.dispatch(json.loads(message['data']))})
+            self.listener = pubsub.run_in_thread(daemon=True, sleep_time=1)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(getattr(settings, 'WALLET_EVENTS_BACKEND', 'wallets.events.LocalBackend'))()
+    return _backend
+
+
+def subscribe(tokens):
+    """ Subscribe the running event loop to the events of the given wallet tokens """
+    get_backend().start()
+    return hub.subscribe(str(token) for token in tokens)
+
+
+def publish(transactions, credited=None):
+    """
+    Publish one event per transaction to its wallet, and to the credited wallet when given
+    (the merchant wallet of charges), once the current database transaction commits.
+    Events carry the credited token so streams can tell a merchant's own charges apart.
+    """
+    data = fast_serializers.transaction_instances(transactions)
+    credited = str(credited.token) if credited is not None else None
+    events = [{'wallet': item['wallet'], 'credited': credited, 'transaction': item} for item in data]
+    if credited is not None:
+        events += [{'wallet': credited, 'credited': credited, 'transaction': item} for item in data]
+    transaction.on_commit(lambda: get_backend().publish(events))
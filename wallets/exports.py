@@ -0,0 +1,59 @@
+"""
+Streaming export of transaction history.
+
+Rows are read with a server-side cursor as plain tuples (no model instances) and written to
+the response as they arrive, so memory stays flat however many transactions are exported.
+"""
+
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+
+from .models import Transaction
+
+EXPORT_FIELDS = ['id', 'wallet', 'amount', 'transaction_type', 'status', 'created_at']
+EXPORT_COLUMNS = ('id', 'wallet__token', 'amount', 'transaction_type', 'status', 'created_at')
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """ File-like object that returns what is written, used to get csv.writer output line by line """
+    def write(self, value):
+        return value
+
+
+def _rows(queryset):
+    """ Yield each transaction as a list of strings, formatted like TransactionSerializer """
+    type_labels = dict(Transaction.TRANSACTION_TYPES)
+    status_labels = dict(Transaction.STATUS_CHOICES)
+    rows = queryset.order_by('created_at', 'id').values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for pk, token, amount, transaction_type, status, created_at in rows:
+        created = created_at.isoformat()
+        if created.endswith('+00:00'):
+            created = created[:-6] + 'Z'
+        yield [pk, str(token), str(amount), type_labels[transaction_type], status_labels[status], created]
+
+
+def stream_ndjson(queryset):
+    for row in _rows(queryset):
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _rows(queryset):
+        yield writer.writerow(row)
+
+
+def export_response(queryset, output):
+    stream = stream_csv(queryset) if output == 'csv' else stream_ndjson(queryset)
+    response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="transactions.{output}"'
+    return response
@@ -0,0 +1,125 @@
+"""
+Serializer-free rendering for the hot list endpoints.
+
+Produces the same JSON as WalletStatusSerializer / TransactionSerializer rendered by DRF's
+JSONRenderer, byte for byte, but from values() rows: no model instances, no per-field
+serializer calls, choice labels looked up in precomputed tables, and the result encoded in one
+go with orjson when it is installed (the standard json module otherwise).
+"""
+
+import json
+from decimal import Decimal
+
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import Transaction
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CENTS = Decimal('0.01')
+TRANSACTION_TYPE_LABELS = dict(Transaction.TRANSACTION_TYPES)
+STATUS_LABELS = dict(Transaction.STATUS_CHOICES)
+
+
+def dumps(data):
+    """ JSON bytes identical to DRF's JSONRenderer output for plain str/int/None data """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def json_response(data):
+    return HttpResponse(dumps(data), content_type='application/json')
+
+
+def format_decimal(value):
+    """ Like serializers.DecimalField(decimal_places=2) """
+    return f'{value.quantize(CENTS):f}'
+
+
+def format_datetime(value, tz):
+    """ Like serializers.DateTimeField with the ISO 8601 output format """
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def wallet_status(wallet):
+    """ WalletStatusSerializer(wallet).data as a plain dict """
+    tz = timezone.get_current_timezone()
+    return {
+        'token': str(wallet.token),
+        'balance': format_decimal(wallet.balance),
+        'created_at': format_datetime(wallet.created_at, tz),
+        'updated_at': format_datetime(wallet.updated_at, tz),
+    }
+
+
+WALLET_STATUS_FIELDS = ('token', 'balance', 'created_at', 'updated_at')
+
+
+def wallet_statuses(rows):
+    """ WalletStatusSerializer(many=True).data for rows read with values(*WALLET_STATUS_FIELDS) """
+    tz = timezone.get_current_timezone()
+    return [
+        {
+            'token': str(row['token']),
+            'balance': format_decimal(row['balance']),
+            'created_at': format_datetime(row['created_at'], tz),
+            'updated_at': format_datetime(row['updated_at'], tz),
+        }
+        for row in rows
+    ]
+
+
+def transaction_values(prefix=''):
+    """
+    values() expressions reading a transaction's fields, optionally through a relation
+    (prefix='transaction__' for ledger entries). Aliased so they never clash with model fields.
+    """
+    return {
+        'txn_id': F(f'{prefix}id'),
+        'txn_token': F(f'{prefix}wallet__token'),
+        'txn_amount': F(f'{prefix}amount'),
+        'txn_type': F(f'{prefix}transaction_type'),
+        'txn_status': F(f'{prefix}status'),
+        'txn_created_at': F(f'{prefix}created_at'),
+    }
+
+
+def transactions(rows):
+    """ TransactionSerializer(many=True).data for rows read with transaction_values() """
+    tz = timezone.get_current_timezone()
+    return [
+        {
+            'id': row['txn_id'],
+            'wallet': str(row['txn_token']),
+            'amount': format_decimal(row['txn_amount']),
+            'transaction_type': TRANSACTION_TYPE_LABELS[row['txn_type']],
+            'status': STATUS_LABELS[row['txn_status']],
+            'created_at': format_datetime(row['txn_created_at'], tz),
+        }
+        for row in rows
+    ]
+
+
+def transaction_instances(instances):
+    """ Same as transactions() for Transaction instances """
+    tz = timezone.get_current_timezone()
+    return [
+        {
+            'id': txn.pk,
+            'wallet': str(txn.wallet.token),
+            'amount': format_decimal(txn.amount),
+            'transaction_type': TRANSACTION_TYPE_LABELS[txn.transaction_type],
+            'status': STATUS_LABELS[txn.status],
+            'created_at': format_datetime(txn.created_at, tz),
+        }
+        for txn in instances
+    ]
@@ -0,0 +1,87 @@
+"""
+Idempotency-Key support for the balance mutating actions.
+
+A client may send an Idempotency-Key header with charge/recharge requests. The first request
+with a given key runs normally and its response is stored together with the key, in the same
+database transaction as the balance change. Retries with the same key get the stored response
+back with a single indexed lookup, without loading the wallet or validating the payload again.
+"""
+
+import functools
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+DEFAULT_TTL = 24 * 60 * 60 # seconds
+
+
+def get_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+
+
+def _replay(record, request):
+    if record.request_path != request.path:
+        return Response({"message": "Idempotency-Key was already used for a different request"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def _lookup(user, key):
+    """ Return the stored record for key, evicting it if it has expired """
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None and record.expires_at <= timezone.now():
+        record.delete()
+        return None
+    return record
+
+
+def idempotent(view_method):
+    """
+    Decorator for viewset actions that makes them honour the Idempotency-Key header.
+    Requests without the header are not affected.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({"message": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+
+        record = _lookup(request.user, key)
+        if record is not None:
+            return _replay(record, request)
+
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                # Server errors are not stored so the client can retry them
+                if response.status_code < 500:
+                    IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        request_path=request.path,
+                        response_status=response.status_code,
+                        response_body=response.data,
+                        expires_at=timezone.now() + timedelta(seconds=get_ttl()),
+                    )
+        except IntegrityError:
+            # A concurrent request with the same key committed first, our changes were rolled back
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None:
+                return Response({"message": "A request with this Idempotency-Key is already in progress"}, status=status.HTTP_409_CONFLICT)
+            return _replay(record, request)
+        return response
+    return wrapper
+
+
+def clear_expired():
+    """ Delete every expired key, returns the number of keys removed """
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,182 @@
+"""
+Balance mutations for wallets.
+
+Every change to Wallet.balance goes through this module. Movements are posted as double-entry
+LedgerEntry legs (a charge debits the client wallet and credits the merchant wallet, a recharge
+credits the client wallet against the external account), inserted with one bulk INSERT per
+posting. Wallet.balance is the projection of a wallet's entries, kept up to date in the same
+database transaction: balances are never read, modified and written back from Python, each
+change is a single conditional UPDATE evaluated by the database, so concurrent charges can never
+overdraw a wallet or lose an update. Cached wallet status entries are invalidated, daily
+snapshots updated and balance change events published (wallets.events) here as well.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+
+from . import cache, events, snapshots
+from .models import LedgerEntry, Wallet, Transaction, TransactionHistory
+
+
+class InsufficientFunds(Exception):
+    """ Raised when a debit would leave a wallet with a negative balance """
+
+
+class InvalidAmount(ValueError):
+    """ Raised when a movement is not strictly positive: its sign is given by debit/credit """
+
+
+def _check_amounts(amounts):
+    for amount in amounts:
+        if amount <= 0:
+            raise InvalidAmount(f"Amount must be greater than zero, got {amount}.")
+
+
+def get_merchant_wallet(merchant):
+    """
+    The wallet credited with the merchant's charges, created on first use.
+    Merchants have a single wallet (unique_merchant_wallet), so its pk and token are cached and
+    the returned instance is usually built without a query; only pk and token are set then.
+    """
+    ref = cache.get_merchant_wallet_ref(merchant.pk)
+    if ref is not None:
+        return Wallet(pk=ref[0], token=ref[1], user_id=merchant.pk, is_merchant=True)
+    wallet = Wallet.objects.filter(user_id=merchant.pk).first()
+    if wallet is None:
+        wallet = Wallet.objects.create(user=merchant)
+    cache.set_merchant_wallet_ref(merchant.pk, wallet)
+    return wallet
+
+
+def _legs(txn, debited, credited):
+    """ The two entries of a posting, None stands for the external account """
+    return [
+        LedgerEntry(transaction_id=txn.pk, wallet=debited, amount=-txn.amount, created_at=txn.created_at),
+        LedgerEntry(transaction_id=txn.pk, wallet=credited, amount=txn.amount, created_at=txn.created_at),
+    ]
+
+
+def debit(wallet, amount, merchant_wallet=None, transaction_type='charge'):
+    """
+    Subtract amount from the wallet, credit it to merchant_wallet (the external account when
+    None) and record the transaction.
+    The balance check and the subtraction happen in the same statement
+    (UPDATE ... SET balance = balance - x WHERE balance >= x).
+    """
+    _check_amounts([amount])
+    with transaction.atomic(savepoint=False):
+        now = timezone.now()
+        updated = Wallet.objects.filter(pk=wallet.pk, balance__gte=amount).update(
+            balance=F('balance') - amount,
+            updated_at=now,
+        )
+        if updated:
+            tokens = [wallet.token]
+            if merchant_wallet is not None:
+                Wallet.objects.filter(pk=merchant_wallet.pk).update(balance=F('balance') + amount, updated_at=now)
+                tokens.append(merchant_wallet.token)
+            cache.invalidate(*tokens)
+            txn = Transaction.objects.create(wallet=wallet, amount=amount, transaction_type=transaction_type, status='success')
+            legs = LedgerEntry.objects.bulk_create(_legs(txn, wallet, merchant_wallet))
+            snapshots.record([txn], credits=[leg for leg in legs if leg.wallet is not None and leg.amount > 0])
+            events.publish([txn], credited=merchant_wallet)
+            return txn
+    # Raised outside the atomic block: nothing was written, so the caller's transaction stays usable
+    raise InsufficientFunds("Insufficient funds available.")
+
+
+def credit(wallet, amount, transaction_type='recharge'):
+    """ Add amount to the wallet from the external account and record the transaction """
+    _check_amounts([amount])
+    with transaction.atomic(savepoint=False):
+        Wallet.objects.filter(pk=wallet.pk).update(
+            balance=F('balance') + amount,
+            updated_at=timezone.now(),
+        )
+        cache.invalidate(wallet.token)
+        txn = Transaction.objects.create(wallet=wallet, amount=amount, transaction_type=transaction_type, status='success')
+        LedgerEntry.objects.bulk_create(_legs(txn, None, wallet))
+        snapshots.record([txn])
+        events.publish([txn])
+        return txn
+
+
+def debit_many(debits, transactions, merchant_wallet=None):
+    """
+    Apply several debits at once, all credited to merchant_wallet.
+    debits maps wallet pk -> total amount and must have been checked against balances
+    read with select_for_update() in the caller's atomic block.
+    All client wallets are updated with one UPDATE, the transactions and their ledger
+    entries inserted with one bulk INSERT each.
+    """
+    if not debits:
+        return []
+    _check_amounts([*debits.values(), *(txn.amount for txn in transactions)])
+    now = timezone.now()
+    Wallet.objects.filter(pk__in=debits).update(
+        balance=F('balance') - Case(*[When(pk=pk, then=total) for pk, total in debits.items()]),
+        updated_at=now,
+    )
+    tokens = {txn.wallet.token for txn in transactions}
+    if merchant_wallet is not None:
+        Wallet.objects.filter(pk=merchant_wallet.pk).update(balance=F('balance') + sum(debits.values()), updated_at=now)
+        tokens.add(merchant_wallet.token)
+    cache.invalidate(*tokens)
+    created = Transaction.objects.bulk_create(transactions)
+    legs = LedgerEntry.objects.bulk_create([leg for txn in created for leg in _legs(txn, txn.wallet, merchant_wallet)])
+    snapshots.record(created, credits=[leg for leg in legs if leg.wallet is not None and leg.amount > 0])
+    events.publish(created, credited=merchant_wallet)
+    return created
+
+
+def credit_many(credits, transactions):
+    """
+    Apply several credits from the external account at once.
+    credits maps wallet pk -> total amount, transactions are the unsaved records to write.
+    All wallets are updated with one UPDATE, the transactions and their ledger entries
+    inserted with one bulk INSERT each.
+    """
+    if not credits:
+        return []
+    _check_amounts([*credits.values(), *(txn.amount for txn in transactions)])
+    Wallet.objects.filter(pk__in=credits).update(
+        balance=F('balance') + Case(*[When(pk=pk, then=total) for pk, total in credits.items()]),
+        updated_at=timezone.now(),
+    )
+    cache.invalidate(*{txn.wallet.token for txn in transactions})
+    created = Transaction.objects.bulk_create(transactions)
+    LedgerEntry.objects.bulk_create([leg for txn in created for leg in _legs(txn, None, txn.wallet)])
+    snapshots.record(created)
+    events.publish(created)
+    return created
+
+
+def merchant_entries(merchant):
+    """
+    Credit legs of the charges made by the merchant. Read through the (wallet, created_at, id)
+    index of the merchant wallet instead of joining transactions through wallet__user.
+    """
+    wallet_ids = list(Wallet.objects.filter(user_id=merchant.pk).values_list('pk', flat=True))
+    return LedgerEntry.objects.filter(wallet_id__in=wallet_ids, amount__gt=0)
+
+
+def merchant_transactions(merchant):
+    """ The charge transactions made by the merchant, in both tiers """
+    return TransactionHistory.objects.filter(pk__in=merchant_entries(merchant).values('transaction_id'))
+
+
+def derived_balance(wallet):
+    """ Balance of the wallet recomputed from its ledger entries """
+    return LedgerEntry.objects.filter(wallet=wallet).aggregate(balance=Sum('amount', default=0))['balance']
+
+
+def rebuild_balance(wallet):
+    """ Reset the balance projection of the wallet to the sum of its entries, returns the new balance """
+    with transaction.atomic(savepoint=False):
+        wallet = Wallet.objects.select_for_update().get(pk=wallet.pk)
+        balance = derived_balance(wallet)
+        if balance != wallet.balance:
+            Wallet.objects.filter(pk=wallet.pk).update(balance=balance, updated_at=timezone.now())
+            cache.invalidate(wallet.token)
+        return balance
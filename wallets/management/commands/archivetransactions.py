@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from wallets import archive
+
+
+class Command(BaseCommand):
+    help = "Move transactions older than the archive horizon from the hot table to the archive tier."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Archive transactions older than this many days (default: TRANSACTION_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=archive.DEFAULT_BATCH_SIZE, help="Transactions moved per database transaction")
+
+    def handle(self, *args, **options):
+        cutoff = archive.get_cutoff(options['days'])
+        moved = archive.archive(cutoff, options['batch_size'])
+        self.stdout.write(f"Archived {moved} transactions created before {cutoff.isoformat()}")
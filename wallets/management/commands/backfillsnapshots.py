@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wallets import snapshots
+from wallets.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily balance snapshots of every wallet (or the given tokens) from the transaction history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tokens', nargs='*', help="Only rebuild the wallets with these tokens")
+
+    def handle(self, *args, **options):
+        wallets = Wallet.objects.all()
+        if options['tokens']:
+            wallets = wallets.filter(token__in=options['tokens'])
+        total = 0
+        for wallet in wallets.iterator():
+            # One transaction per wallet so a long backfill never holds a global lock
+            with transaction.atomic():
+                total += snapshots.backfill(wallet)
+        self.stdout.write(f"Wrote {total} daily snapshots")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from wallets.idempotency import clear_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records. Meant to be run periodically (e.g. from cron)."
+
+    def handle(self, *args, **options):
+        deleted = clear_expired()
+        self.stdout.write(f"Deleted {deleted} expired idempotency keys")
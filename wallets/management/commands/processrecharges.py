@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets import recharge_queue
+
+
+class Command(BaseCommand):
+    help = "Apply the recharges queued in write-behind mode, in batches. Runs until interrupted unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Recharges applied per database transaction (default: RECHARGE_QUEUE_BATCH_SIZE)")
+        parser.add_argument('--interval', type=float, default=0.5, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit")
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = recharge_queue.drain(options['batch_size'])
+                total += processed
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Applied {total} queued recharges")
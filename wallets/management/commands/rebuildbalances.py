@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from wallets import ledger
+from wallets.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Recompute the balance of every wallet (or the given tokens) from its ledger entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tokens', nargs='*', help="Only rebuild the wallets with these tokens")
+        parser.add_argument('--check', action='store_true', help="Only report the wallets whose balance differs from their entries")
+
+    def handle(self, *args, **options):
+        wallets = Wallet.objects.all()
+        if options['tokens']:
+            wallets = wallets.filter(token__in=options['tokens'])
+        mismatches = 0
+        for wallet in wallets.iterator():
+            derived = ledger.derived_balance(wallet)
+            if derived == wallet.balance:
+                continue
+            mismatches += 1
+            self.stdout.write(f"{wallet.token}: balance {wallet.balance}, entries {derived}")
+            if not options['check']:
+                ledger.rebuild_balance(wallet)
+        verb = "Found" if options['check'] else "Rebuilt"
+        self.stdout.write(f"{verb} {mismatches} wallets out of balance")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0005_transaction_wallet_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('opening_balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('charge_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('charge_count', models.PositiveIntegerField(default=0)),
+                ('recharge_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('recharge_count', models.PositiveIntegerField(default=0)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_snapshots', to='wallets.wallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'day'), name='unique_wallet_daily_snapshot')],
+            },
+        ),
+    ]
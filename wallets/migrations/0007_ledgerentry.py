@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_entries(apps, schema_editor):
+    """
+    Post the existing transactions. The merchant of past charges is unknown since 0003,
+    their counter leg goes to the external account like the one of recharges.
+
+    Balances were never derived from the transactions, so each wallet then gets an opening
+    balance posting for whatever its transactions do not explain (initial balances, direct
+    edits), leaving Wallet.balance equal to the sum of its entries.
+    """
+    Wallet = apps.get_model('wallets', 'Wallet')
+    Transaction = apps.get_model('wallets', 'Transaction')
+    LedgerEntry = apps.get_model('wallets', 'LedgerEntry')
+    entries = []
+    for pk, wallet_id, amount, transaction_type, created_at in Transaction.objects.values_list(
+        'pk', 'wallet_id', 'amount', 'transaction_type', 'created_at',
+    ).iterator(chunk_size=2000):
+        signed = -amount if transaction_type == 'charge' else amount
+        entries.append(LedgerEntry(transaction_id=pk, wallet_id=wallet_id, amount=signed, created_at=created_at))
+        entries.append(LedgerEntry(transaction_id=pk, wallet_id=None, amount=-signed, created_at=created_at))
+        if len(entries) >= 2000:
+            LedgerEntry.objects.bulk_create(entries)
+            entries = []
+    LedgerEntry.objects.bulk_create(entries)
+
+    posted = dict(
+        LedgerEntry.objects.filter(wallet__isnull=False).values('wallet_id').annotate(total=Sum('amount')).values_list('wallet_id', 'total')
+    )
+    entries = []
+    for wallet_id, balance, created_at in Wallet.objects.values_list('pk', 'balance', 'created_at').iterator(chunk_size=2000):
+        opening = balance - posted.get(wallet_id, 0)
+        if not opening:
+            continue
+        txn = Transaction.objects.create(
+            wallet_id=wallet_id, amount=abs(opening), transaction_type='recharge' if opening > 0 else 'charge',
+        )
+        # created_at is auto_now_add, date the posting back to the wallet's creation
+        Transaction.objects.filter(pk=txn.pk).update(created_at=created_at)
+        entries.append(LedgerEntry(transaction_id=txn.pk, wallet_id=wallet_id, amount=opening, created_at=created_at))
+        entries.append(LedgerEntry(transaction_id=txn.pk, wallet_id=None, amount=-opening, created_at=created_at))
+        if len(entries) >= 2000:
+            LedgerEntry.objects.bulk_create(entries)
+            entries = []
+    LedgerEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0006_walletdailysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='wallets.transaction')),
+                ('wallet', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='wallets.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'created_at', 'id'], name='ledger_entry_wallet_created')],
+            },
+        ),
+        migrations.RunPython(backfill_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def flag_merchant_wallets(apps, schema_editor):
+    Wallet = apps.get_model('wallets', 'Wallet')
+    Wallet.objects.filter(user__user_type='merchant').update(is_merchant=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0008_queuedrecharge'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='is_merchant',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(flag_merchant_wallets, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wallet',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_merchant', True)), fields=('user',), name='unique_merchant_wallet', violation_error_message='Merchants can only have one wallet'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._history_view import create_history_view
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0009_wallet_unique_merchant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_type', models.CharField(choices=[('charge', 'Charge'), ('recharge', 'Recharge')], max_length=8)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('failed', 'Failed')], max_length=8)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'wallets_transactionhistory',
+                'managed': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='transaction',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='entries', to='wallets.transactionhistory'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_type', models.CharField(choices=[('charge', 'Charge'), ('recharge', 'Recharge')], max_length=8)),
+                ('status', models.CharField(choices=[('success', 'Success'), ('failed', 'Failed')], max_length=8)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='wallets.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'created_at', 'id'], name='archived_txn_wallet_created')],
+            },
+        ),
+        create_history_view(),
+    ]
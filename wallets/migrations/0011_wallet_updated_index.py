@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0010_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallet',
+            index=models.Index(fields=['updated_at', 'id'], name='wallet_updated'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+"""
+The wallets_transactionhistory view (TransactionHistory), shared by the migrations.
+
+SQLite rebuilds a table for most schema changes (create a copy, drop, rename) and refuses the
+rename while a view reads the dropped table; PostgreSQL refuses to change the type of a column a
+view reads. Every migration altering Transaction or ArchivedTransaction must therefore wrap its
+operations with around_history_view(), which drops the view first and recreates it afterwards.
+When the columns of the view change, update COLUMNS here.
+"""
+
+from django.db import migrations
+
+COLUMNS = 'id, wallet_id, amount, transaction_type, status, created_at'
+
+CREATE_HISTORY_VIEW = f"""
+CREATE VIEW wallets_transactionhistory AS
+SELECT {COLUMNS} FROM wallets_transaction
+UNION ALL
+SELECT {COLUMNS} FROM wallets_archivedtransaction
+"""
+
+DROP_HISTORY_VIEW = 'DROP VIEW IF EXISTS wallets_transactionhistory'
+
+
+def create_history_view():
+    return migrations.RunSQL(CREATE_HISTORY_VIEW, DROP_HISTORY_VIEW)
+
+
+def drop_history_view():
+    return migrations.RunSQL(DROP_HISTORY_VIEW, CREATE_HISTORY_VIEW)
+
+
+def around_history_view(*operations):
+    """ operations preceded by dropping the view and followed by recreating it """
+    return [drop_history_view(), *operations, create_history_view()]
@@ -1,7 +1,7 @@
 from django.db import models
 import uuid
 from django.conf import settings
-from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class Wallet(models.Model):
@@ -12,25 +12,36 @@ class Wallet(models.Model):
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    is_merchant = models.BooleanField(default=False, editable=False) # Copy of user.user_type == 'merchant', set on creation
 
-    def clean(self):
-        super().clean()
-        # Check if merchant and ensure they don't have more than one wallet
-        if self.user.user_type == 'merchant':
-            existing_wallets = Wallet.objects.filter(user=self.user)
-            if existing_wallets.exists() and (not self.pk or self.pk not in existing_wallets.values_list('id', flat=True)):
-                raise ValidationError('Merchants can only have one wallet')
+    class Meta:
+        constraints = [
+            # Merchants can only have one wallet
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_merchant=True),
+                name='unique_merchant_wallet',
+                violation_error_message='Merchants can only have one wallet',
+            ),
+        ]
+        indexes = [
+            # Serves the client wallet listing ordered by (updated_at, id) and its activity filters
+            models.Index(fields=['updated_at', 'id'], name='wallet_updated'),
+        ]
 
-
-    # Save method to validate wallet
+    # Save method to validate new wallets, later saves (e.g. balance changes) skip validation
     def save(self, *args, **kwargs):
-        self.full_clean()
+        if self._state.adding:
+            self.is_merchant = self.user.user_type == 'merchant'
+            # The token is random, only a merchant's wallet needs its constraint checked
+            self.full_clean(validate_unique=False, validate_constraints=self.is_merchant)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.email} - {self.balance} - {self.token}"
     
 
+# Read by the wallets_transactionhistory view: wrap schema migrations with migrations/_history_view.py
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('charge', 'Charge'),
@@ -47,6 +58,161 @@ class Transaction(models.Model):
     status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='success')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves the per wallet listings ordered by (created_at, id)
+            models.Index(fields=['wallet', 'created_at', 'id'], name='transaction_wallet_created'),
+        ]
+
     def __str__(self):
             transaction_by = 'Merchant' if self.wallet.user.user_type == 'merchant' else 'Client'
-            return f"{transaction_by} Transaction: {self.transaction_type} - {self.status} - {self.amount}"
\ No newline at end of file
+            return f"{transaction_by} Transaction: {self.transaction_type} - {self.status} - {self.amount}"
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Cold tier of the transaction history: transactions older than TRANSACTION_ARCHIVE_AFTER_DAYS
+    are moved here, keeping their id, by the archivetransactions command.
+    Read by the wallets_transactionhistory view, see migrations/_history_view.py before altering it.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    wallet = models.ForeignKey('Wallet', related_name='archived_transactions', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_type = models.CharField(max_length=8, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=8, choices=Transaction.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'created_at', 'id'], name='archived_txn_wallet_created'),
+        ]
+
+    def __str__(self):
+        return f"Archived Transaction: {self.transaction_type} - {self.status} - {self.amount}"
+
+
+class TransactionHistory(models.Model):
+    """
+    Read-only view over both tiers (UNION ALL of Transaction and ArchivedTransaction, created by
+    migration 0010). Migrations altering either table must drop and recreate the view around
+    their operations, see migrations/_history_view.py. Listings, exports and merchant ledger entries read from here, so archiving
+    is transparent to them while the hot table and its indexes stay small.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    wallet = models.ForeignKey('Wallet', related_name='+', on_delete=models.DO_NOTHING, db_constraint=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_type = models.CharField(max_length=8, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=8, choices=Transaction.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'wallets_transactionhistory'
+
+    def __str__(self):
+        return f"Transaction: {self.transaction_type} - {self.status} - {self.amount}"
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a double-entry posting. Every transaction is written as legs summing to zero:
+    a charge debits the client wallet and credits the merchant wallet, a recharge credits the
+    client wallet against the external funding account (wallet is null).
+    Entries are append-only, Wallet.balance is the projection of a wallet's entries.
+    """
+    # Points into either tier, archiving a transaction leaves its entries in place
+    transaction = models.ForeignKey('TransactionHistory', related_name='entries', on_delete=models.DO_NOTHING, db_constraint=False)
+    wallet = models.ForeignKey('Wallet', related_name='ledger_entries', null=True, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2) # Positive for credits, negative for debits
+    created_at = models.DateTimeField() # Copied from the transaction
+
+    class Meta:
+        indexes = [
+            # Serves the merchant listings (the credit legs of their wallet) ordered by (created_at, id)
+            models.Index(fields=['wallet', 'created_at', 'id'], name='ledger_entry_wallet_created'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.wallet_id} - {self.amount}"
+
+
+class WalletDailySnapshot(models.Model):
+    """
+    Per wallet, per day summary of the balance movements.
+    Kept up to date by the ledger as transactions are written, so statements and historical
+    balances can be answered without scanning every transaction.
+    """
+    wallet = models.ForeignKey('Wallet', related_name='daily_snapshots', on_delete=models.CASCADE)
+    day = models.DateField()
+    opening_balance = models.DecimalField(max_digits=10, decimal_places=2)
+    closing_balance = models.DecimalField(max_digits=10, decimal_places=2)
+    charge_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    charge_count = models.PositiveIntegerField(default=0)
+    recharge_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    recharge_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'day'], name='unique_wallet_daily_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.wallet_id} - {self.day} - {self.opening_balance} -> {self.closing_balance}"
+
+
+class QueuedRecharge(models.Model):
+    """
+    Recharge accepted in write-behind mode (RECHARGE_WRITE_BEHIND), waiting to be applied.
+    The processrecharges worker drains pending rows in batches and records the outcome here.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='queued_recharges')
+    wallet = models.ForeignKey('Wallet', related_name='queued_recharges', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default='pending')
+    error = models.CharField(max_length=255, blank=True)
+    transaction = models.OneToOneField('Transaction', null=True, blank=True, related_name='queued_recharge', on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker takes the oldest pending rows first
+            models.Index(fields=['status', 'created_at'], name='queued_recharge_status'),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.amount} - {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a charge/recharge request sent with an Idempotency-Key header.
+    A retried request with the same key is answered from here without touching the wallet.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_path = models.CharField(max_length=255) # Path the key was first used with
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} - {self.request_path} - {self.response_status}"
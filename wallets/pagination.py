@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TransactionCursorPagination(CursorPagination):
+    """
+    Keyset pagination for transaction listings, newest first.
+    The cursor encodes the position in (created_at, id) so every page is an index range scan,
+    deep pages cost the same as the first one.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class WalletCursorPagination(CursorPagination):
+    """
+    Keyset pagination for wallet listings, most recently active first, over the
+    (updated_at, id) index. Pages are capped at max_page_size wallets whatever the filters.
+    A wallet whose balance changes while a client pages through moves to the first page.
+    """
+    ordering = ('-updated_at', '-id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
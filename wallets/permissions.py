@@ -1,5 +1,5 @@
 from rest_framework import viewsets, permissions
-from .models import Transaction
+from . import ledger
 """
 Custom permissions to only allow merchants/clients to access certain actions.
 """
@@ -19,8 +19,8 @@ class IsOwnerOrMerchant(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if obj.user == request.user:
             return True
-        # Merchants can view if they have a transaction with this wallet
-        return request.user.user_type == 'merchant' and Transaction.objects.filter(wallet=obj, merchant=request.user).exists()
+        # Merchants can view if they have charged this wallet
+        return request.user.user_type == 'merchant' and ledger.merchant_entries(request.user).filter(transaction__wallet=obj).exists()
 
 class CanRecharge(permissions.BasePermission):
     """
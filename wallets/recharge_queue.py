@@ -0,0 +1,84 @@
+"""
+Write-behind queue for recharges.
+
+With RECHARGE_WRITE_BEHIND enabled, a recharge request is validated, stored as a pending
+QueuedRecharge row (a single INSERT) and answered with 202 and the row id. The processrecharges
+worker drains the queue in batches: each batch is applied with one balance UPDATE and bulk
+INSERTs through ledger.credit_many, in a single database transaction, so a burst of recharges
+becomes a few large commits instead of one transaction per request. Callers poll
+/wallets/recharges/<id>/ for the outcome.
+
+Pending rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it,
+so several workers can run against PostgreSQL. On SQLite run a single worker.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from . import ledger
+from .models import QueuedRecharge, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return getattr(settings, 'RECHARGE_WRITE_BEHIND', False)
+
+
+def get_batch_size():
+    return getattr(settings, 'RECHARGE_QUEUE_BATCH_SIZE', 500)
+
+
+def enqueue(user, wallet, amount):
+    """ Queue a recharge of the wallet, returns the pending QueuedRecharge """
+    return QueuedRecharge.objects.create(user=user, wallet=wallet, amount=amount)
+
+
+def _claim(batch_size):
+    pending = QueuedRecharge.objects.filter(status='pending').order_by('created_at').select_related('wallet')
+    if connection.features.has_select_for_update_skip_locked:
+        pending = pending.select_for_update(skip_locked=True, of=('self',))
+    return list(pending[:batch_size])
+
+
+def _apply_one(item):
+    """ Apply a single recharge in its own savepoint, used when its batch could not be applied """
+    try:
+        with transaction.atomic():
+            item.transaction = ledger.credit(item.wallet, item.amount)
+            item.status = 'success'
+    except (DatabaseError, ledger.InvalidAmount) as e:
+        logger.warning("Queued recharge %s failed: %s", item.pk, e)
+        item.status, item.error = 'failed', str(e)[:255]
+
+
+def drain(batch_size=None):
+    """ Apply the oldest pending recharges, at most batch_size of them; returns how many were processed """
+    with transaction.atomic():
+        batch = _claim(batch_size or get_batch_size())
+        if not batch:
+            return 0
+        credits = {}
+        for item in batch:
+            credits[item.wallet_id] = credits.get(item.wallet_id, 0) + item.amount
+        try:
+            with transaction.atomic():
+                created = ledger.credit_many(credits, [
+                    Transaction(wallet=item.wallet, amount=item.amount, transaction_type='recharge', status='success')
+                    for item in batch
+                ])
+            for item, txn in zip(batch, created):
+                item.status, item.transaction = 'success', txn
+        except (DatabaseError, ledger.InvalidAmount):
+            # e.g. a balance overflowing its column or a non-positive amount queued by an older
+            # release: fall back to one recharge at a time
+            for item in batch:
+                _apply_one(item)
+        processed_at = timezone.now()
+        for item in batch:
+            item.processed_at = processed_at
+        QueuedRecharge.objects.bulk_update(batch, ['status', 'error', 'transaction', 'processed_at'])
+    return len(batch)
@@ -1,5 +1,11 @@
+from collections import OrderedDict
+from django.db import transaction as db_transaction
 from rest_framework import serializers
-from .models import Wallet, Transaction
+from users.models import User
+from . import ledger, recharge_queue
+from .models import Wallet, Transaction, QueuedRecharge
+
+MAX_CHARGE_BATCH_SIZE = 1000
 
 class WalletCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,6 +19,7 @@ class WalletChargeSerializer(serializers.Serializer):
     def validate_amount(self, value):
         """
         Checks that ampunt is not negative and that there is available balance.
+        The balance check here is only a fast rejection, the ledger re-checks it atomically.
         """
         wallet = self.context['wallet']
         if value <= 0:
@@ -21,38 +28,118 @@ class WalletChargeSerializer(serializers.Serializer):
             raise serializers.ValidationError("Insufficient funds available.")
         return value
 
+    def validate(self, data):
+        # Debit and credit legs would land on the same wallet, as rejected by the batch charge
+        if self.context['wallet'].user_id == self.context['merchant'].pk:
+            raise serializers.ValidationError("Merchants cannot charge their own wallet.")
+        return data
+
     def create(self, validated_data):
         """
-        Deduct the charge amount from the wallet's balance and create a transaction record.
+        Deduct the charge amount from the wallet's balance, credit it to the merchant's wallet
+        and create a transaction record.
         """
         wallet = self.context['wallet']
-        wallet.balance -= validated_data['amount']
-        wallet.save(update_fields=['balance'])
-        transaction = Transaction.objects.create(
-            wallet=wallet,
-            amount=validated_data['amount'],
-            transaction_type='charge',
-            status='success'
-        )
-        return transaction
+        merchant_wallet = ledger.get_merchant_wallet(self.context['merchant'])
+        try:
+            return ledger.debit(wallet, validated_data['amount'], merchant_wallet)
+        except ledger.InsufficientFunds as e:
+            # The balance changed between validation and the debit
+            raise serializers.ValidationError({'amount': [str(e)]})
     
+class WalletChargeItemSerializer(serializers.Serializer):
+    """ A single entry of a batch charge """
+    token = serializers.UUIDField() # Wallet token
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Charge amount must be greater than zero.")
+        return value
+
+class WalletChargeBatchSerializer(serializers.Serializer):
+    """
+    Serializer for settling many charges at once.
+    Items are applied in order; each one either succeeds or is reported as failed without affecting the others.
+    """
+    charges = WalletChargeItemSerializer(many=True, allow_empty=False, max_length=MAX_CHARGE_BATCH_SIZE)
+
+    def create(self, validated_data):
+        """
+        Load every wallet in one query, check balances in memory and apply all debits
+        with a single UPDATE plus a single bulk INSERT of transactions and one of ledger entries.
+        """
+        merchant = self.context['merchant']
+        charges = validated_data['charges']
+        tokens = {item['token'] for item in charges}
+        with db_transaction.atomic():
+            merchant_wallet = ledger.get_merchant_wallet(merchant)
+            wallets = {
+                wallet.token: wallet
+                for wallet in Wallet.objects.select_for_update().filter(token__in=tokens)
+            }
+            balances = {token: wallet.balance for token, wallet in wallets.items()}
+            debits = OrderedDict()
+            pending = []
+            results = []
+            for item in charges:
+                token, amount = item['token'], item['amount']
+                result = {'token': str(token), 'amount': str(amount)}
+                wallet = wallets.get(token)
+                if wallet is None:
+                    result.update(status='failed', error="Wallet with this token does not exist.")
+                elif wallet.user_id == merchant.pk:
+                    result.update(status='failed', error="Merchants cannot charge their own wallet.")
+                elif balances[token] < amount:
+                    result.update(status='failed', error="Insufficient funds available.")
+                else:
+                    balances[token] -= amount
+                    debits[wallet.pk] = debits.get(wallet.pk, 0) + amount
+                    pending.append((result, Transaction(wallet=wallet, amount=amount, transaction_type='charge', status='success')))
+                    result['status'] = 'success'
+                results.append(result)
+
+            created = ledger.debit_many(debits, [txn for _, txn in pending], merchant_wallet)
+            for (result, _), txn in zip(pending, created):
+                result['transaction'] = txn.pk
+        return results
+
 class WalletRechargeSerializer(serializers.Serializer):
     """ Serializer for recharging a wallet"""
-    token = serializers.UUIDField(required=True) # Wallet token
+    token = serializers.UUIDField(required=True, source='wallet.token') # Wallet token
     amount = serializers.DecimalField(max_digits=10, decimal_places=2)
 
     def validate_token(self, value):
-        if not Wallet.objects.filter(token=value).exists():
+        # The wallet of the URL is already loaded, only look up a different one
+        wallet = self.context.get('wallet')
+        if wallet is None or wallet.token != value:
+            wallet = Wallet.objects.filter(token=value).first()
+        if wallet is None:
             raise serializers.ValidationError("Wallet with this token does not exist.")
+        self._wallet = wallet
         return value
-    
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Recharge amount must be greater than zero.")
+        return value
+
     def create(self, validated_data):
-        wallet = Wallet.objects.get(token=validated_data['token'])
-        wallet.balance += validated_data['amount']
-        wallet.save()
-        # Create a transaction record
-        transaction = Transaction.objects.create(wallet=wallet, amount=validated_data['amount'], transaction_type='recharge')
-        return transaction
+        # Add the amount in the database and create a transaction record
+        return ledger.credit(self._wallet, validated_data['amount'])
+
+    def enqueue(self, user):
+        """ Queue the validated recharge for the write-behind worker instead of applying it """
+        return recharge_queue.enqueue(user, self._wallet, self.validated_data['amount'])
+
+class QueuedRechargeSerializer(serializers.ModelSerializer):
+    """ Outcome of a recharge accepted in write-behind mode """
+    token = serializers.UUIDField(source='wallet.token', read_only=True)
+
+    class Meta:
+        model = QueuedRecharge
+        fields = ['id', 'token', 'amount', 'status', 'error', 'transaction', 'created_at', 'processed_at']
+        read_only_fields = fields
 
 class WalletStatusSerializer(serializers.ModelSerializer):
     class Meta:
@@ -75,4 +162,97 @@ class TransactionSerializer(serializers.ModelSerializer):
         representation['wallet'] = instance.wallet.token  # Displaying the wallet's token instead of the id
         representation['transaction_type'] = instance.get_transaction_type_display()
         representation['status'] = instance.get_status_display()
-        return representation
\ No newline at end of file
+        return representation
+
+class LedgerEntrySerializer(TransactionSerializer):
+    """ A merchant's credit leg, displayed as the charge transaction it belongs to """
+    def to_representation(self, instance):
+        return super().to_representation(instance.transaction)
+
+class TransactionFilterSerializer(serializers.Serializer):
+    """ Query parameters used to narrow down a transaction listing """
+    start = serializers.DateTimeField(required=False) # created_at >= start
+    end = serializers.DateTimeField(required=False) # created_at < end
+    transaction_type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPES, required=False)
+    status = serializers.ChoiceField(choices=Transaction.STATUS_CHOICES, required=False)
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if 'start' in data:
+            queryset = queryset.filter(created_at__gte=data['start'])
+        if 'end' in data:
+            queryset = queryset.filter(created_at__lt=data['end'])
+        if 'transaction_type' in data:
+            queryset = queryset.filter(transaction_type=data['transaction_type'])
+        if 'status' in data:
+            queryset = queryset.filter(status=data['status'])
+        return queryset
+
+class TransactionExportSerializer(TransactionFilterSerializer):
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+
+
+class AnalyticsQuerySerializer(TransactionFilterSerializer):
+    interval = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+
+class AnalyticsBucketSerializer(serializers.Serializer):
+    period = serializers.DateTimeField()
+    count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class AnalyticsSerializer(serializers.Serializer):
+    """ Aggregated transaction figures for a period """
+    interval = serializers.CharField()
+    count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2, allow_null=True)
+    average = serializers.DecimalField(max_digits=14, decimal_places=2, allow_null=True)
+    histogram = AnalyticsBucketSerializer(many=True)
+
+class ClientWalletFilterSerializer(serializers.Serializer):
+    """ Query parameters used to narrow down the client wallet listing """
+    token = serializers.RegexField(r'^[0-9a-fA-F-]{1,36}$', required=False) # Token prefix
+    email = serializers.EmailField(required=False) # Owner's email
+    min_balance = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_balance = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    active_since = serializers.DateTimeField(required=False) # updated_at >= active_since
+    active_until = serializers.DateTimeField(required=False) # updated_at < active_until
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if 'token' in data:
+            queryset = queryset.filter(token__startswith=data['token'].lower())
+        if 'email' in data:
+            queryset = queryset.filter(user__email=User.objects.normalize_email(data['email']))
+        if 'min_balance' in data:
+            queryset = queryset.filter(balance__gte=data['min_balance'])
+        if 'max_balance' in data:
+            queryset = queryset.filter(balance__lte=data['max_balance'])
+        if 'active_since' in data:
+            queryset = queryset.filter(updated_at__gte=data['active_since'])
+        if 'active_until' in data:
+            queryset = queryset.filter(updated_at__lt=data['active_until'])
+        return queryset
+
+class StatementQuerySerializer(serializers.Serializer):
+    """ Query parameters of a wallet statement """
+    start = serializers.DateField()
+    end = serializers.DateField()
+    as_of = serializers.DateTimeField(required=False) # Also report the balance at this moment
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        return data
+
+class StatementSerializer(serializers.Serializer):
+    """ Wallet movements over a period of days """
+    start = serializers.DateField()
+    end = serializers.DateField()
+    opening_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    closing_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
+    charge_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    charge_count = serializers.IntegerField()
+    recharge_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    recharge_count = serializers.IntegerField()
+    as_of = serializers.DateTimeField(required=False)
+    balance_as_of = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
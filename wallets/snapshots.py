@@ -0,0 +1,166 @@
+"""
+Daily balance snapshots.
+
+The ledger calls record() for every transaction it writes, which folds the amount into the
+WalletDailySnapshot row of that wallet and day. Statements and historical balances are then
+computed from the snapshots plus, at most, the ledger entries of a single day.
+The charge columns count outgoing movements, the recharge columns incoming ones: recharges
+and, for merchant wallets, the credit leg of the charges they made.
+"""
+
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import LedgerEntry, Wallet, WalletDailySnapshot
+
+ZERO = Decimal('0.00')
+SUMMARY_FIELDS = ('charge_total', 'charge_count', 'recharge_total', 'recharge_count')
+
+
+def _totals(transactions):
+    """ Group (wallet_id, amount, transaction_type) tuples into per wallet summary values """
+    totals = {}
+    for wallet_id, amount, transaction_type in transactions:
+        summary = totals.setdefault(wallet_id, dict.fromkeys(SUMMARY_FIELDS, 0))
+        summary[f'{transaction_type}_total'] += amount
+        summary[f'{transaction_type}_count'] += 1
+    return totals
+
+
+def _delta(summary):
+    return summary['recharge_total'] - summary['charge_total']
+
+
+def record(transactions, credits=()):
+    """
+    Fold newly written transactions, and the merchant credit legs of charges, into the
+    snapshots of the day they were created.
+    Must run in the same database transaction as the balance update, after it.
+    """
+    by_day = {}
+    for txn in transactions:
+        by_day.setdefault(timezone.localdate(txn.created_at), []).append((txn.wallet_id, txn.amount, txn.transaction_type))
+    for entry in credits:
+        by_day.setdefault(timezone.localdate(entry.created_at), []).append((entry.wallet_id, entry.amount, 'recharge'))
+    for day, rows in by_day.items():
+        _record_day(day, _totals(rows))
+
+
+def _record_day(day, totals):
+    snapshots = WalletDailySnapshot.objects.filter(day=day)
+    if len(totals) == 1:
+        # Common case (single charge or recharge): try the update first, one query when the row exists
+        (wallet_id, summary), = totals.items()
+        existing = {wallet_id} if snapshots.filter(wallet_id=wallet_id).update(**_increments(summary)) else set()
+    else:
+        existing = set(snapshots.filter(wallet_id__in=totals).values_list('wallet_id', flat=True))
+        if existing:
+            snapshots.filter(wallet_id__in=existing).update(**{
+                field: F(field) + Case(*[When(wallet_id=pk, then=Value(value)) for pk, value in values.items()], output_field=output)
+                for field, values, output in _grouped_increments({pk: totals[pk] for pk in existing})
+            })
+
+    missing = [pk for pk in totals if pk not in existing]
+    if missing:
+        # First movement of the day: the balance was already updated, so opening = balance - delta
+        balances = dict(Wallet.objects.filter(pk__in=missing).values_list('pk', 'balance'))
+        WalletDailySnapshot.objects.bulk_create([
+            WalletDailySnapshot(
+                wallet_id=pk,
+                day=day,
+                opening_balance=balances[pk] - _delta(totals[pk]),
+                closing_balance=balances[pk],
+                **totals[pk],
+            )
+            for pk in missing
+        ])
+
+
+def _increments(summary):
+    increments = {field: F(field) + summary[field] for field in SUMMARY_FIELDS}
+    increments['closing_balance'] = F('closing_balance') + _delta(summary)
+    return increments
+
+
+def _grouped_increments(totals):
+    """ Yield (field, {wallet_id: increment}, output_field) for a single multi-wallet UPDATE """
+    for field in SUMMARY_FIELDS:
+        output = IntegerField() if field.endswith('_count') else DecimalField()
+        yield field, {pk: summary[field] for pk, summary in totals.items()}, output
+    yield 'closing_balance', {pk: _delta(summary) for pk, summary in totals.items()}, DecimalField()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def balance_as_of(wallet, moment):
+    """
+    Balance of the wallet at the given aware datetime.
+    Uses the snapshot of that day (or the last one before it) plus the ledger entries
+    of that day up to the moment.
+    """
+    day = timezone.localdate(moment)
+    snapshot = WalletDailySnapshot.objects.filter(wallet=wallet, day__lte=day).order_by('-day').first()
+    if snapshot is None:
+        # Before the first movement the balance is what the first active day opened with
+        opening = WalletDailySnapshot.objects.filter(wallet=wallet, day__gt=day).order_by('day').values_list('opening_balance', flat=True).first()
+        return opening if opening is not None else ZERO
+    if snapshot.day < day:
+        return snapshot.closing_balance
+    moved = LedgerEntry.objects.filter(
+        wallet=wallet, created_at__gte=_day_start(day), created_at__lte=moment,
+    ).aggregate(total=Sum('amount', default=ZERO))['total']
+    return snapshot.opening_balance + moved
+
+
+def statement(wallet, start, end):
+    """ Summary of the wallet movements between the start and end days (both included) """
+    period = WalletDailySnapshot.objects.filter(wallet=wallet, day__gte=start, day__lte=end)
+    summary = period.aggregate(
+        charge_total=Sum('charge_total', default=ZERO),
+        charge_count=Sum('charge_count', default=0),
+        recharge_total=Sum('recharge_total', default=ZERO),
+        recharge_count=Sum('recharge_count', default=0),
+    )
+    opening = WalletDailySnapshot.objects.filter(wallet=wallet, day__lt=start).order_by('-day').values_list('closing_balance', flat=True).first()
+    if opening is None:
+        # No movement before the period: it opens with the balance of its first active day
+        opening = period.order_by('day').values_list('opening_balance', flat=True).first()
+    if opening is None:
+        opening = ZERO
+    summary['opening_balance'] = opening
+    summary['closing_balance'] = opening + summary['recharge_total'] - summary['charge_total']
+    return summary
+
+
+def backfill(wallet):
+    """
+    Rebuild every snapshot of the wallet from its ledger entries.
+    Balances are walked backwards from the current balance, the same anchor the ledger uses.
+    """
+    days = (
+        LedgerEntry.objects.filter(wallet=wallet)
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(
+            charge_total=-Sum('amount', filter=Q(amount__lt=0), default=ZERO),
+            charge_count=Count('id', filter=Q(amount__lt=0)),
+            recharge_total=Sum('amount', filter=Q(amount__gt=0), default=ZERO),
+            recharge_count=Count('id', filter=Q(amount__gt=0)),
+        )
+        .order_by('-day')
+    )
+    closing = Wallet.objects.filter(pk=wallet.pk).values_list('balance', flat=True).get()
+    snapshots = []
+    for row in days:
+        opening = closing - _delta(row)
+        snapshots.append(WalletDailySnapshot(wallet=wallet, opening_balance=opening, closing_balance=closing, **row))
+        closing = opening
+    WalletDailySnapshot.objects.filter(wallet=wallet).delete()
+    WalletDailySnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
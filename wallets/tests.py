@@ -1,3 +1,978 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from users.authentication import issue_token
+from users.models import User
+from wallet_service import db, metrics
+from . import ledger, recharge_queue, snapshots
+from .migrations._history_view import around_history_view
+from .models import ArchivedTransaction, LedgerEntry, QueuedRecharge, Transaction, TransactionHistory, Wallet
+from .serializers import LedgerEntrySerializer, TransactionSerializer, WalletStatusSerializer
+
+
+def at(day, hour=12):
+    return datetime(2026, 1, day, hour, tzinfo=dt_timezone.utc)
+
+
+@override_settings(TOKEN_BUCKET_RATES={})
+class WalletTestCase(TestCase):
+    """ A merchant and two clients, each client wallet funded with 100.00 through the ledger """
+
+    def setUp(self):
+        cache.clear()
+        self.merchant = User.objects.create(email='merchant@example.com', user_type='merchant')
+        self.merchant_wallet = Wallet.objects.create(user=self.merchant)
+        self.client_user = User.objects.create(email='client@example.com', user_type='client')
+        self.wallet = Wallet.objects.create(user=self.client_user)
+        self.other_user = User.objects.create(email='other@example.com', user_type='client')
+        self.other_wallet = Wallet.objects.create(user=self.other_user)
+        for wallet in (self.wallet, self.other_wallet):
+            ledger.credit(wallet, Decimal('100.00'))
+
+    def api(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def balance(self, wallet):
+        return Wallet.objects.values_list('balance', flat=True).get(pk=wallet.pk)
+
+
+class ChargeBatchTests(WalletTestCase):
+
+    def test_results_follow_the_request_order(self):
+        missing = '00000000-0000-0000-0000-000000000000'
+        response = self.api(self.merchant).post('/wallets/wallets/charge-batch/', [
+            {'token': str(self.wallet.token), 'amount': '30'},
+            {'token': str(self.wallet.token), 'amount': '80'},
+            {'token': missing, 'amount': '1'},
+            {'token': str(self.other_wallet.token), 'amount': '70'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['success', 'failed', 'failed', 'success'])
+        self.assertEqual(results[1]['error'], "Insufficient funds available.")
+        self.assertEqual(results[2]['error'], "Wallet with this token does not exist.")
+        self.assertTrue(Transaction.objects.filter(pk=results[0]['transaction'], amount=Decimal('30.00')).exists())
+        self.assertEqual(self.balance(self.wallet), Decimal('70.00'))
+        self.assertEqual(self.balance(self.other_wallet), Decimal('30.00'))
+        self.assertEqual(self.balance(self.merchant_wallet), Decimal('100.00'))
+
+    def test_accepts_a_charges_object(self):
+        response = self.api(self.merchant).post('/wallets/wallets/charge-batch/', {
+            'charges': [{'token': str(self.wallet.token), 'amount': '5'}],
+        }, format='json')
+        self.assertEqual(response.json()['results'][0]['status'], 'success')
+        self.assertEqual(self.balance(self.wallet), Decimal('95.00'))
+
+    def test_clients_cannot_charge(self):
+        response = self.api(self.client_user).post('/wallets/wallets/charge-batch/', [
+            {'token': str(self.other_wallet.token), 'amount': '5'},
+        ], format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.balance(self.other_wallet), Decimal('100.00'))
+
+
+class LedgerTests(WalletTestCase):
+
+    def test_debit_never_overdraws(self):
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.debit(self.wallet, Decimal('100.01'), self.merchant_wallet)
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+        self.assertFalse(Transaction.objects.filter(transaction_type='charge').exists())
+
+        ledger.debit(self.wallet, Decimal('100.00'), self.merchant_wallet)
+        self.assertEqual(self.balance(self.wallet), Decimal('0.00'))
+
+    def test_non_positive_amounts_are_rejected(self):
+        calls = [
+            lambda: ledger.credit(self.wallet, Decimal('-500')),
+            lambda: ledger.debit(self.wallet, Decimal('0'), self.merchant_wallet),
+            lambda: ledger.credit_many({self.wallet.pk: Decimal('-1')}, []),
+            lambda: ledger.debit_many({self.wallet.pk: Decimal('-1')}, []),
+        ]
+        for call in calls:
+            with self.assertRaises(ledger.InvalidAmount):
+                call()
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+
+
+class ChargeRechargeTests(WalletTestCase):
+
+    def test_recharge(self):
+        response = self.api(self.client_user).post(
+            f'/wallets/wallets/{self.wallet.token}/recharge/', {'token': str(self.wallet.token), 'amount': '25.50'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balance(self.wallet), Decimal('125.50'))
+
+    def test_recharge_rejects_non_positive_amounts(self):
+        for amount in ('-500', '0'):
+            response = self.api(self.client_user).post(
+                f'/wallets/wallets/{self.wallet.token}/recharge/', {'token': str(self.wallet.token), 'amount': amount}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('amount', response.json())
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+
+    def test_charge(self):
+        response = self.api(self.merchant).post(f'/wallets/wallets/{self.wallet.token}/charge/', {'amount': '40'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.api(self.merchant).post(f'/wallets/wallets/{self.wallet.token}/charge/', {'amount': '60.01'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.balance(self.wallet), Decimal('60.00'))
+
+
+class IdempotencyTests(WalletTestCase):
+
+    def test_replay_returns_the_stored_response(self):
+        client = self.api(self.merchant)
+        url = f'/wallets/wallets/{self.wallet.token}/charge/'
+        first = client.post(url, {'amount': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='charge-1')
+        retry = client.post(url, {'amount': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='charge-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(self.balance(self.wallet), Decimal('90.00'))
+
+    def test_key_reused_on_another_request(self):
+        client = self.api(self.merchant)
+        client.post(f'/wallets/wallets/{self.wallet.token}/charge/', {'amount': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='charge-1')
+        other = client.post(f'/wallets/wallets/{self.other_wallet.token}/charge/', {'amount': '10'}, format='json', HTTP_IDEMPOTENCY_KEY='charge-1')
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(self.balance(self.other_wallet), Decimal('100.00'))
+
+    def test_keys_are_scoped_to_the_user(self):
+        url = f'/wallets/wallets/{self.wallet.token}/recharge/'
+        body = {'token': str(self.wallet.token), 'amount': '5'}
+        for _ in range(2):
+            self.api(self.client_user).post(url, body, format='json', HTTP_IDEMPOTENCY_KEY='recharge-1')
+        self.assertEqual(self.balance(self.wallet), Decimal('105.00'))
+        response = self.api(self.merchant).post(f'/wallets/wallets/{self.wallet.token}/charge/', {'amount': '5'}, format='json', HTTP_IDEMPOTENCY_KEY='recharge-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+
+class TransactionListTests(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for amount in ('1', '2', '3', '4', '5', '6'):
+            ledger.debit(self.wallet, Decimal(amount), self.merchant_wallet)
+
+    def walk(self, client, url):
+        """ Follow the next links from url, returns the ids listed and the number of pages """
+        ids, pages = [], 0
+        while url:
+            data = client.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url, pages = data['next'], pages + 1
+        return ids, pages
+
+    def test_cursor_pages(self):
+        ids, pages = self.walk(self.api(self.client_user), '/wallets/transactions/?page_size=3')
+        expected = list(Transaction.objects.filter(wallet=self.wallet).order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_clients_only_list_their_wallets(self):
+        ids, _ = self.walk(self.api(self.other_user), '/wallets/transactions/')
+        self.assertEqual(ids, list(Transaction.objects.filter(wallet=self.other_wallet).values_list('pk', flat=True)))
+
+
+class ExportTests(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Transaction.objects.filter(wallet=self.wallet).update(created_at=at(2, 3))
+        self.txn = Transaction.objects.get(wallet=self.wallet)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response = self.api(self.client_user).get('/wallets/transactions/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(self.content(response), (
+            f'{{"id": {self.txn.pk}, "wallet": "{self.wallet.token}", "amount": "100.00", '
+            f'"transaction_type": "Recharge", "status": "Success", "created_at": "2026-01-02T03:00:00Z"}}\n'
+        ))
+
+    def test_csv(self):
+        response = self.api(self.client_user).get('/wallets/transactions/export/?output=csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.csv"')
+        self.assertEqual(self.content(response), (
+            'id,wallet,amount,transaction_type,status,created_at\r\n'
+            f'{self.txn.pk},{self.wallet.token},100.00,Recharge,Success,2026-01-02T03:00:00Z\r\n'
+        ))
+
+    def test_filters(self):
+        client = self.api(self.client_user)
+        self.assertEqual(self.content(client.get('/wallets/transactions/export/?start=2026-01-03T00:00:00Z')), '')
+        self.assertEqual(self.content(client.get('/wallets/transactions/export/?transaction_type=charge')), '')
+        self.assertEqual(client.get('/wallets/transactions/export/?output=xml').status_code, 400)
+
+
+class WalletStatusCacheTests(WalletTestCase):
+
+    def test_hits_skip_the_database(self):
+        client = self.api(self.client_user)
+        url = f'/wallets/wallets/{self.wallet.token}/'
+        self.assertEqual(client.get(url).json()['balance'], '100.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(url).json()['balance'], '100.00')
+
+    def test_ledger_changes_invalidate(self):
+        client = self.api(self.client_user)
+        for url in (f'/wallets/wallets/{self.wallet.token}/', f'/wallets/wallets/{str(self.wallet.token).upper()}/'):
+            client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.credit(self.wallet, Decimal('7.00'))
+        for url in (f'/wallets/wallets/{self.wallet.token}/', f'/wallets/wallets/{str(self.wallet.token).upper()}/'):
+            self.assertEqual(client.get(url).json()['balance'], '107.00')
+
+    def test_access_is_checked_on_hits(self):
+        url = f'/wallets/wallets/{self.wallet.token}/'
+        self.api(self.client_user).get(url)
+        self.assertEqual(self.api(self.other_user).get(url).status_code, 404)
+        self.assertEqual(self.api(self.client_user).get('/wallets/wallets/not-a-token/').status_code, 404)
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        merchant = User.objects.create(email='merchant@example.com', user_type='merchant')
+        self.merchant_wallet = Wallet.objects.create(user=merchant)
+        self.client_user = User.objects.create(email='client@example.com', user_type='client')
+        self.wallet = Wallet.objects.create(user=self.client_user)
+        movements = [
+            (at(1), lambda: ledger.credit(self.wallet, Decimal('100.00'))),
+            (at(2, 9), lambda: ledger.debit(self.wallet, Decimal('30.00'), self.merchant_wallet)),
+            (at(2, 15), lambda: ledger.credit(self.wallet, Decimal('10.00'))),
+            (at(3), lambda: ledger.debit(self.wallet, Decimal('5.00'), self.merchant_wallet)),
+        ]
+        for moment, movement in movements:
+            with mock.patch('django.utils.timezone.now', return_value=moment):
+                movement()
+
+    def test_statement(self):
+        self.assertEqual(snapshots.statement(self.wallet, at(2).date(), at(3).date()), {
+            'opening_balance': Decimal('100.00'),
+            'closing_balance': Decimal('75.00'),
+            'charge_total': Decimal('35.00'),
+            'charge_count': 2,
+            'recharge_total': Decimal('10.00'),
+            'recharge_count': 1,
+        })
+
+    def test_balance_as_of(self):
+        self.assertEqual(snapshots.balance_as_of(self.wallet, datetime(2025, 12, 31, tzinfo=dt_timezone.utc)), Decimal('0.00'))
+        self.assertEqual(snapshots.balance_as_of(self.wallet, at(2, 12)), Decimal('70.00'))
+        self.assertEqual(snapshots.balance_as_of(self.wallet, at(2, 16)), Decimal('80.00'))
+        self.assertEqual(snapshots.balance_as_of(self.wallet, at(10)), Decimal('75.00'))
+
+    def test_statement_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.client_user)
+        response = client.get(f'/wallets/wallets/{self.wallet.token}/statement/?start=2026-01-02&end=2026-01-02&as_of=2026-01-02T12:00:00Z')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['opening_balance'], data['closing_balance'], data['balance_as_of']), ('100.00', '80.00', '70.00'))
+
+    def test_backfill_matches_the_maintained_snapshots(self):
+        maintained = list(self.wallet.daily_snapshots.order_by('day').values_list('day', 'opening_balance', 'closing_balance'))
+        self.wallet.daily_snapshots.all().delete()
+        snapshots.backfill(self.wallet)
+        self.assertEqual(list(self.wallet.daily_snapshots.order_by('day').values_list('day', 'opening_balance', 'closing_balance')), maintained)
+
+
+class AnalyticsTests(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rival = User.objects.create(email='rival@example.com', user_type='merchant')
+        rival_wallet = Wallet.objects.create(user=rival)
+        charges = [
+            (at(1, 9), self.wallet, '10.00', self.merchant_wallet),
+            (at(1, 15), self.other_wallet, '20.00', self.merchant_wallet),
+            (at(2, 9), self.wallet, '30.00', self.merchant_wallet),
+            (at(2, 9), self.wallet, '40.00', rival_wallet),
+        ]
+        for moment, wallet, amount, merchant_wallet in charges:
+            with mock.patch('django.utils.timezone.now', return_value=moment):
+                ledger.debit(wallet, Decimal(amount), merchant_wallet)
+
+    def test_daily_summary(self):
+        response = self.api(self.merchant).get('/wallets/transactions/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'interval': 'day',
+            'count': 3,
+            'total': '60.00',
+            'average': '20.00',
+            'histogram': [
+                {'period': '2026-01-01T00:00:00Z', 'count': 2, 'total': '30.00'},
+                {'period': '2026-01-02T00:00:00Z', 'count': 1, 'total': '30.00'},
+            ],
+        })
+
+    def test_hourly_histogram_of_a_window(self):
+        response = self.api(self.merchant).get('/wallets/transactions/analytics/?interval=hour&end=2026-01-02T00:00:00Z')
+        data = response.json()
+        self.assertEqual((data['count'], data['total']), (2, '30.00'))
+        self.assertEqual([bucket['period'] for bucket in data['histogram']], ['2026-01-01T09:00:00Z', '2026-01-01T15:00:00Z'])
+
+    def test_empty_window_and_errors(self):
+        client = self.api(self.merchant)
+        data = client.get('/wallets/transactions/analytics/?start=2027-01-01T00:00:00Z').json()
+        self.assertEqual((data['count'], data['total'], data['average'], data['histogram']), (0, None, None, []))
+        self.assertEqual(client.get('/wallets/transactions/analytics/?interval=week').status_code, 400)
+        self.assertEqual(self.api(self.client_user).get('/wallets/transactions/analytics/').status_code, 403)
+
+
+class AsyncViewTests(WalletTestCase):
+
+    async def test_reads_match_the_sync_endpoints(self):
+        await self.async_client.aforce_login(self.client_user)
+        await sync_to_async(ledger.debit)(self.wallet, Decimal('1.00'), self.merchant_wallet)
+        sync_client = await sync_to_async(self.api)(self.client_user)
+        for async_url, sync_url in (
+            ('/wallets/async/wallet/', f'/wallets/wallets/{self.wallet.token}/'),
+            ('/wallets/async/transactions/?page_size=1', '/wallets/transactions/?page_size=1'),
+        ):
+            response = await self.async_client.get(async_url)
+            expected = await sync_to_async(sync_client.get)(sync_url)
+            self.assertEqual(response.status_code, 200)
+            # Cursors differ between the two implementations, the rows may not
+            data, expected_data = response.json(), expected.json()
+            self.assertEqual(data.get('results', data), expected_data.get('results', expected_data))
+
+    async def test_transaction_pages(self):
+        await self.async_client.aforce_login(self.client_user)
+        for amount in ('1', '2'):
+            await sync_to_async(ledger.debit)(self.wallet, Decimal(amount), self.merchant_wallet)
+        url, amounts = '/wallets/async/transactions/?page_size=2', []
+        while url:
+            data = (await self.async_client.get(url)).json()
+            amounts += [row['amount'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(amounts, ['2.00', '1.00', '100.00'])
+
+    async def test_writes(self):
+        await self.async_client.aforce_login(self.merchant)
+        url = f'/wallets/async/wallets/{self.wallet.token}/charge/'
+        response = await self.async_client.post(url, {'amount': '40'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post(url, {'amount': '60.01'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        await self.async_client.aforce_login(self.client_user)
+        url = f'/wallets/async/wallets/{self.wallet.token}/recharge/'
+        response = await self.async_client.post(url, {'token': str(self.wallet.token), 'amount': '5'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post(f'/wallets/async/wallets/{self.other_wallet.token}/recharge/', {'token': str(self.other_wallet.token), 'amount': '5'}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(await sync_to_async(self.balance)(self.wallet), Decimal('65.00'))
+
+    async def test_anonymous_requests_are_refused(self):
+        self.assertEqual((await self.async_client.get('/wallets/async/wallet/')).status_code, 403)
+        self.assertEqual((await self.async_client.post(f'/wallets/async/wallets/{self.wallet.token}/charge/', {'amount': '1'}, content_type='application/json')).status_code, 403)
+
+
+class MetricsTests(WalletTestCase):
+
+    def series(self, label):
+        return dict(metrics.registry.duration.series[label]), dict(metrics.registry.queries.series[label])
+
+    def test_requests_are_recorded_per_view(self):
+        label = 'WalletViewSet.charge'
+        (duration, queries) = self.series(label)
+        self.api(self.merchant).post(f'/wallets/wallets/{self.wallet.token}/charge/', {'amount': '1'}, format='json')
+        (new_duration, new_queries) = self.series(label)
+        self.assertEqual(new_duration['count'], duration['count'] + 1)
+        self.assertGreater(new_queries['sum'], queries['sum'])
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn(f'wallet_request_duration_seconds_count{{view="{label}"}} {new_duration["count"]}', body)
+        self.assertIn(f'wallet_request_queries_bucket{{view="{label}",le="+Inf"}}', body)
+        self.assertNotIn('view="metrics_view"', body)
+
+    @override_settings(METRICS_N_PLUS_ONE_THRESHOLD=1)
+    def test_repeated_statements_are_flagged(self):
+        label = 'TransactionViewSet.list'
+        flagged = metrics.registry.n_plus_one[label]
+        with self.assertLogs('wallet_service.metrics', 'WARNING'):
+            self.api(self.client_user).get('/wallets/transactions/')
+        self.assertEqual(metrics.registry.n_plus_one[label], flagged + 1)
+
+
+class AsyncAuthenticationTests(WalletTestCase):
+
+    def test_bearer_token_writes_skip_csrf(self):
+        client = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION=f'Bearer {issue_token(self.merchant)}')
+        response = client.post(f'/wallets/async/wallets/{self.wallet.token}/charge/', {'amount': '1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balance(self.wallet), Decimal('99.00'))
+
+    def test_session_writes_need_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.merchant)
+        url = f'/wallets/async/wallets/{self.wallet.token}/charge/'
+        response = client.post(url, {'amount': '1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.json()['detail'].startswith('CSRF Failed'))
+
+        client.get('/api-auth/login/')
+        response = client.post(url, {'amount': '1'}, content_type='application/json', HTTP_X_CSRFTOKEN=client.cookies['csrftoken'].value)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_tokens(self):
+        for header in ('Bearer nope', 'Bearer a b'):
+            response = Client(HTTP_AUTHORIZATION=header).get('/wallets/async/wallet/')
+            self.assertEqual(response.status_code, 401)
+
+
+class DoubleEntryTests(WalletTestCase):
+
+    def assertLedgerBalanced(self):
+        for wallet in Wallet.objects.all():
+            self.assertEqual(ledger.derived_balance(wallet), wallet.balance, wallet.token)
+        for txn in Transaction.objects.all():
+            self.assertEqual(sum(LedgerEntry.objects.filter(transaction_id=txn.pk).values_list('amount', flat=True)), 0)
+
+    def test_entries_sum_to_balance(self):
+        ledger.debit(self.wallet, Decimal('12.50'), self.merchant_wallet)
+        ledger.debit_many(
+            {self.wallet.pk: Decimal('5.00'), self.other_wallet.pk: Decimal('7.25')},
+            [Transaction(wallet=self.wallet, amount=Decimal('5.00'), transaction_type='charge', status='success'),
+             Transaction(wallet=self.other_wallet, amount=Decimal('7.25'), transaction_type='charge', status='success')],
+            self.merchant_wallet,
+        )
+        ledger.credit_many(
+            {self.other_wallet.pk: Decimal('3.00')},
+            [Transaction(wallet=self.other_wallet, amount=Decimal('3.00'), transaction_type='recharge', status='success')],
+        )
+        self.assertEqual(self.balance(self.wallet), Decimal('82.50'))
+        self.assertEqual(self.balance(self.other_wallet), Decimal('95.75'))
+        self.assertEqual(self.balance(self.merchant_wallet), Decimal('24.75'))
+        self.assertLedgerBalanced()
+
+    def test_rebuild_balances(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('1.00'))
+        stdout = StringIO()
+        call_command('rebuildbalances', '--check', stdout=stdout)
+        self.assertIn(f"{self.wallet.token}: balance 1.00, entries 100", stdout.getvalue())
+        self.assertTrue(stdout.getvalue().endswith("Found 1 wallets out of balance\n"))
+        self.assertEqual(self.balance(self.wallet), Decimal('1.00'))
+        call_command('rebuildbalances', stdout=StringIO())
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+
+    def test_merchants_list_their_charges(self):
+        ledger.debit(self.wallet, Decimal('1.00'), self.merchant_wallet)
+        rival = User.objects.create(email='rival@example.com', user_type='merchant')
+        ledger.debit(self.other_wallet, Decimal('2.00'), Wallet.objects.create(user=rival))
+        results = self.api(self.merchant).get('/wallets/transactions/').json()['results']
+        self.assertEqual([(row['wallet'], row['amount']) for row in results], [(str(self.wallet.token), '1.00')])
+
+    def test_merchants_cannot_charge_their_own_wallet(self):
+        ledger.debit(self.wallet, Decimal('50.00'), self.merchant_wallet)
+        client = self.api(self.merchant)
+        response = client.post(f'/wallets/wallets/{self.merchant_wallet.token}/charge/', {'amount': '5'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ["Merchants cannot charge their own wallet."]})
+        response = client.post('/wallets/wallets/charge-batch/', [{'token': str(self.merchant_wallet.token), 'amount': '5'}], format='json')
+        self.assertEqual(response.json()['results'][0]['error'], "Merchants cannot charge their own wallet.")
+        response = Client(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.merchant)}').post(
+            f'/wallets/async/wallets/{self.merchant_wallet.token}/charge/', {'amount': '5'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.balance(self.merchant_wallet), Decimal('50.00'))
+        self.assertLedgerBalanced()
+
+
+class LedgerBackfillMigrationTests(TransactionTestCase):
+    users = ('users', '0004_user_type_index')
+    before, after = [('wallets', '0006_walletdailysnapshot'), users], [('wallets', '0007_ledgerentry'), users]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_opening_balances(self):
+        apps = self.migrate(self.before)
+        User, Wallet, Transaction = (apps.get_model(*model) for model in (('users', 'User'), ('wallets', 'Wallet'), ('wallets', 'Transaction')))
+        funded = Wallet.objects.create(user=User.objects.create(email='funded@example.com'), balance=Decimal('200.00'))
+        charged = Wallet.objects.create(user=User.objects.create(email='charged@example.com'), balance=Decimal('900.00'))
+        Transaction.objects.create(wallet=charged, amount=Decimal('100.00'), transaction_type='charge')
+        empty = Wallet.objects.create(user=User.objects.create(email='empty@example.com'))
+
+        apps = self.migrate(self.after)
+        LedgerEntry = apps.get_model('wallets', 'LedgerEntry')
+        for wallet, balance in ((funded, Decimal('200.00')), (charged, Decimal('900.00')), (empty, Decimal('0.00'))):
+            self.assertEqual(sum(LedgerEntry.objects.filter(wallet_id=wallet.pk).values_list('amount', flat=True)), balance)
+        self.assertEqual(sum(LedgerEntry.objects.values_list('amount', flat=True)), 0)
+        opening = apps.get_model('wallets', 'Transaction').objects.filter(wallet_id=charged.pk).exclude(transaction_type='charge').get()
+        self.assertEqual((opening.amount, opening.created_at), (Decimal('1000.00'), charged.created_at))
+        self.assertFalse(LedgerEntry.objects.filter(wallet_id=empty.pk).exists())
+
+
+@override_settings(TOKEN_BUCKET_RATES={}, RECHARGE_WRITE_BEHIND=True)
+class RechargeQueueTests(WalletTestCase):
+
+    def recharge(self, amount):
+        return self.api(self.client_user).post(
+            f'/wallets/wallets/{self.wallet.token}/recharge/', {'token': str(self.wallet.token), 'amount': amount}, format='json')
+
+    def test_recharges_are_queued_then_drained_in_batches(self):
+        ids = []
+        for amount in ('1', '2', '3'):
+            response = self.recharge(amount)
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['status'], 'pending')
+            ids.append(response.json()['id'])
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+
+        with CaptureQueriesContext(connection) as pair:
+            self.assertEqual(recharge_queue.drain(batch_size=2), 2)
+        self.assertEqual(self.balance(self.wallet), Decimal('103.00'))
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(recharge_queue.drain(batch_size=2), 1)
+        # A batch costs the same statements however many recharges it holds
+        self.assertEqual(len(pair), len(single))
+        self.assertEqual(recharge_queue.drain(), 0)
+        self.assertEqual(self.balance(self.wallet), Decimal('106.00'))
+
+        data = self.api(self.client_user).get(f'/wallets/recharges/{ids[0]}/').json()
+        self.assertEqual((data['status'], data['amount']), ('success', '1.00'))
+        self.assertEqual(Transaction.objects.get(pk=data['transaction']).amount, Decimal('1.00'))
+        self.assertEqual(self.api(self.other_user).get(f'/wallets/recharges/{ids[0]}/').status_code, 404)
+
+    def test_invalid_items_fall_back_to_one_at_a_time(self):
+        self.recharge('5')
+        bad = QueuedRecharge.objects.create(user=self.client_user, wallet=self.wallet, amount=Decimal('-5'))
+        with self.assertLogs('wallets.recharge_queue', 'WARNING'):
+            self.assertEqual(recharge_queue.drain(), 2)
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, 'failed')
+        self.assertIsNone(bad.transaction)
+        self.assertEqual(QueuedRecharge.objects.exclude(pk=bad.pk).get().status, 'success')
+        self.assertEqual(self.balance(self.wallet), Decimal('105.00'))
+
+    def test_processrecharges_command(self):
+        self.recharge('5')
+        stdout = StringIO()
+        call_command('processrecharges', '--once', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "Applied 1 queued recharges\n")
+        self.assertEqual(self.balance(self.wallet), Decimal('105.00'))
+
+
+class SqliteSetupTests(TestCase):
+
+    def configure(self, name):
+        executed = []
+        connection = mock.MagicMock(vendor='sqlite', settings_dict={'NAME': name})
+        connection.cursor.return_value.__enter__.return_value.execute.side_effect = executed.append
+        db.configure_sqlite(sender=None, connection=connection)
+        return executed
+
+    def test_new_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+    def test_tracked_database_keeps_its_journal_mode(self):
+        self.assertEqual(self.configure(settings.SQLITE_TRACKED_DATABASE), ['PRAGMA synchronous = NORMAL'])
+        self.assertEqual(self.configure('/tmp/other.sqlite3'), ['PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL'])
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """ Reads of safe requests go to a second SQLite file, a stale copy of the primary """
+
+    @classmethod
+    def setUpClass(cls):
+        # Declared once the runner has set up its databases, the replica is filled by the test
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        connections.settings['replica'] = {**connections['default'].settings_dict, 'NAME': cls.replica_path}
+        cls.databases = cls.databases | {'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections.settings['replica']
+        del connections['replica']
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        cache.clear()
+        user = User.objects.create(email='client@example.com', user_type='client')
+        wallet = Wallet.objects.create(user=user)
+        ledger.credit(wallet, Decimal('10.00'))
+        connections['replica'].close()
+        with sqlite3.connect(self.replica_path) as replica:
+            connections['default'].ensure_connection()
+            connections['default'].connection.backup(replica)
+        ledger.credit(wallet, Decimal('5.00'))  # Not replicated yet
+
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {issue_token(user)}')
+        with override_settings(DATABASE_REPLICAS=['replica'], TOKEN_BUCKET_RATES={}):
+            self.assertEqual(len(client.get('/wallets/transactions/').json()['results']), 1)
+            response = client.post(f'/wallets/wallets/{wallet.token}/recharge/', {'token': str(wallet.token), 'amount': '1'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('replica_pin', response.cookies)
+            self.assertEqual(len(client.get('/wallets/transactions/').json()['results']), 3)
+            client.cookies.pop('replica_pin')
+            self.assertEqual(len(client.get('/wallets/transactions/').json()['results']), 1)
+
+
+class WalletModelTests(WalletTestCase):
+
+    def test_one_wallet_per_merchant(self):
+        with self.assertRaisesMessage(ValidationError, 'Merchants can only have one wallet'):
+            Wallet.objects.create(user=self.merchant)
+        Wallet.objects.create(user=self.client_user)
+        self.assertEqual(self.client_user.wallets.count(), 2)
+
+    def test_saves_skip_validation_queries(self):
+        # The owner's existence check and the INSERT, no lookup of the random token
+        with self.assertNumQueries(2):
+            Wallet.objects.create(user=self.client_user)
+        wallet = Wallet.objects.get(pk=self.wallet.pk)
+        with self.assertNumQueries(1):
+            wallet.save()
+
+
+class ArchiveTests(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.long_ago = timezone.now() - timedelta(days=400)
+        with mock.patch('django.utils.timezone.now', return_value=self.long_ago):
+            ledger.debit(self.wallet, Decimal('10.00'), self.merchant_wallet)
+            ledger.credit(self.wallet, Decimal('4.00'))
+        ledger.debit(self.wallet, Decimal('1.00'), self.merchant_wallet)
+        self.client_api, self.merchant_api = self.api(self.client_user), self.api(self.merchant)
+
+    def responses(self):
+        return [
+            self.client_api.get('/wallets/transactions/?page_size=2').json()['results'],
+            b''.join(self.client_api.get('/wallets/transactions/export/').streaming_content),
+            self.client_api.get(f'/wallets/wallets/{self.wallet.token}/statement/?start={self.long_ago.date()}&end={timezone.localdate()}').json(),
+            self.merchant_api.get('/wallets/transactions/').json()['results'],
+        ]
+
+    def test_archiving_changes_no_response(self):
+        before = self.responses()
+        stdout = StringIO()
+        call_command('archivetransactions', '--days', '30', '--batch-size', '1', stdout=stdout)
+        self.assertTrue(stdout.getvalue().startswith("Archived 2 transactions created before "))
+
+        self.assertEqual(sorted(ArchivedTransaction.objects.values_list('amount', flat=True)), [Decimal('4.00'), Decimal('10.00')])
+        self.assertFalse(Transaction.objects.filter(created_at=self.long_ago).exists())
+        self.assertEqual(TransactionHistory.objects.filter(wallet=self.wallet).count(), 4)
+        self.assertEqual(self.responses(), before)
+
+    def test_history_view_wraps_migrations(self):
+        operations = around_history_view('operation')
+        self.assertEqual(operations[1], 'operation')
+        self.assertTrue(operations[0].sql.startswith('DROP VIEW'))
+        self.assertIn('CREATE VIEW', operations[2].sql)
+
+
+@override_settings(TOKEN_BUCKET_RATES={
+    'merchant': {'burst': 2, 'rate': 0.01},
+    'client': {'burst': 100, 'rate': 50},
+    'wallet': {'burst': 1, 'rate': 0.01},
+})
+class ThrottleTests(WalletTestCase):
+
+    def test_user_bucket_answers_429(self):
+        client = self.api(self.merchant)
+        codes = [client.post(f'/wallets/wallets/{wallet.token}/charge/', {'amount': '1'}, format='json').status_code
+                 for wallet in (self.wallet, self.other_wallet)]
+        self.assertEqual(codes, [200, 200])
+        response = client.post('/wallets/wallets/charge-batch/', [{'token': str(self.wallet.token), 'amount': '1'}], format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.balance(self.wallet), Decimal('99.00'))
+
+    def test_wallet_bucket_follows_the_credited_wallet(self):
+        target = self.other_wallet.token
+        for user, wallet, expected in ((self.other_user, self.other_wallet, 200), (self.client_user, self.wallet, 429)):
+            response = self.api(user).post(
+                f'/wallets/wallets/{wallet.token}/recharge/', {'token': str(target).upper(), 'amount': '1'}, format='json')
+            self.assertEqual(response.status_code, expected)
+        self.assertEqual(self.balance(self.other_wallet), Decimal('101.00'))
+
+    def test_charges_ignore_the_body_token(self):
+        url = f'/wallets/wallets/{self.wallet.token}/charge/'
+        codes = [self.api(self.merchant).post(url, {'token': str(uuid.uuid4()), 'amount': '1'}, format='json').status_code
+                 for _ in range(2)]
+        self.assertEqual(codes, [200, 429])
+        self.assertEqual(self.balance(self.wallet), Decimal('99.00'))
+
+    def test_async_endpoints_share_the_buckets(self):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.client_user)}')
+        url = f'/wallets/async/wallets/{self.wallet.token}/recharge/'
+        codes = [client.post(url, {'token': token, 'amount': '1'}, content_type='application/json').status_code
+                 for token in (str(self.wallet.token), str(self.wallet.token).upper())]
+        self.assertEqual(codes, [200, 429])
+        self.assertIn('wallet_throttle_decisions_total{scope="wallet",decision="throttled"}', metrics.registry.render())
+
+
+class FastSerializationTests(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ledger.debit(self.wallet, Decimal('1.50'), self.merchant_wallet)
+        ledger.credit(self.wallet, Decimal('1234567.89'))
+
+    def render(self, serializer_class, instances):
+        return JSONRenderer().render(serializer_class(instances, many=True).data)
+
+    def test_transaction_pages_match_the_serializers(self):
+        response = self.api(self.client_user).get('/wallets/transactions/')
+        transactions = TransactionHistory.objects.filter(wallet=self.wallet).order_by('-created_at', '-id')
+        self.assertEqual(response.content, b'{"next":null,"previous":null,"results":' + self.render(TransactionSerializer, transactions) + b'}')
+
+        response = self.api(self.merchant).get('/wallets/transactions/')
+        entries = ledger.merchant_entries(self.merchant).order_by('-created_at', '-id')
+        self.assertEqual(response.content, b'{"next":null,"previous":null,"results":' + self.render(LedgerEntrySerializer, entries) + b'}')
+
+    def test_status_matches_the_serializer(self):
+        response = self.api(self.client_user).get(f'/wallets/wallets/{self.wallet.token}/')
+        self.assertEqual(response.content, JSONRenderer().render(WalletStatusSerializer(Wallet.objects.get(pk=self.wallet.pk)).data))
+
+    def test_browsable_api_still_renders(self):
+        response = self.api(self.client_user).get('/wallets/transactions/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '1234567.89')
+
+
+class ConditionalGetTests(WalletTestCase):
+
+    def assertNotModified(self, client, url, etag):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_wallet_status(self):
+        client = self.api(self.client_user)
+        url = f'/wallets/wallets/{self.wallet.token}/'
+        response = client.get(url)
+        self.assertIn('Last-Modified', response)
+        self.assertNotModified(client, url, response['ETag'])
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.credit(self.wallet, Decimal('7.00'))
+        changed = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['balance'], '107.00')
+
+    def test_token_case_shares_cache_entry(self):
+        client = self.api(self.client_user)
+        url = f'/wallets/wallets/{str(self.wallet.token).upper()}/'
+        etag = client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.credit(self.wallet, Decimal('7.00'))
+        response = client.get(url)
+        self.assertEqual(response.json()['balance'], '107.00')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(client.get('/wallets/wallets/not-a-token/').status_code, 404)
+
+    def test_transaction_list(self):
+        for user, change in (
+            (self.client_user, lambda: ledger.credit(self.wallet, Decimal('1.00'))),
+            (self.merchant, lambda: ledger.debit(self.other_wallet, Decimal('1.00'), self.merchant_wallet)),
+        ):
+            client = self.api(user)
+            etag = client.get('/wallets/transactions/')['ETag']
+            self.assertNotModified(client, '/wallets/transactions/', etag)
+            change()
+            self.assertEqual(client.get('/wallets/transactions/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_not_modified_transaction_list_costs_one_query(self):
+        client = self.api(self.client_user)
+        etag = client.get('/wallets/transactions/')['ETag']
+        with self.assertNumQueries(1) as queries:
+            self.assertNotModified(client, '/wallets/transactions/', etag)
+        # The newest row is read from the index, not aggregated over the whole history
+        self.assertNotIn('MAX(', queries.captured_queries[0]['sql'])
+        self.assertIn('LIMIT 1', queries.captured_queries[0]['sql'])
+
+    def test_empty_transaction_list(self):
+        client = self.api(User.objects.create(email='new@example.com'))
+        response = client.get('/wallets/transactions/')
+        self.assertEqual(response.json()['results'], [])
+        self.assertNotIn('Last-Modified', response)
+        self.assertNotModified(client, '/wallets/transactions/', response['ETag'])
+
+
+class EventStreamTests(WalletTestCase):
+
+    async def next_frame(self, frames):
+        chunk = await asyncio.wait_for(frames.__anext__(), 5)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    def credit(self, wallet, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ledger.credit(wallet, amount)
+
+    def debit(self, wallet, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ledger.debit(wallet, amount, self.merchant_wallet)
+
+    async def test_balance_changes_are_pushed(self):
+        headers = {'Authorization': f'Bearer {issue_token(self.client_user)}'}
+        response = await self.async_client.get('/wallets/async/events/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = aiter(response.streaming_content)
+        try:
+            self.assertEqual(await self.next_frame(frames), 'retry: 3000\n\n')
+            await sync_to_async(self.credit)(self.other_wallet, Decimal('1.00'))
+            txn = await sync_to_async(self.credit)(self.wallet, Decimal('5.00'))
+            frame = await self.next_frame(frames)
+        finally:
+            await frames.aclose()
+        event, event_id, data = frame.strip().split('\n')
+        self.assertEqual((event, event_id), ('event: transaction', f'id: {txn.pk}'))
+        data = json.loads(data.removeprefix('data: '))
+        self.assertEqual(data['wallet']['balance'], '105.00')
+        self.assertEqual(data['transaction']['amount'], '5.00')
+
+    async def test_clients_only_subscribe_to_their_wallets(self):
+        headers = {'Authorization': f'Bearer {issue_token(self.client_user)}'}
+        response = await self.async_client.get('/wallets/async/events/', {'wallet': str(self.other_wallet.token)}, headers=headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get('/wallets/async/events/', {'wallet': 'nope'}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_merchants_receive_their_charges(self):
+        headers = {'Authorization': f'Bearer {issue_token(self.merchant)}'}
+        response = await self.async_client.get('/wallets/async/events/', headers=headers)
+        frames = aiter(response.streaming_content)
+        try:
+            await self.next_frame(frames)
+            txn = await sync_to_async(self.debit)(self.wallet, Decimal('3.00'))
+            frame = await self.next_frame(frames)
+        finally:
+            await frames.aclose()
+        data = json.loads(frame.strip().split('\n')[2].removeprefix('data: '))
+        self.assertEqual((data['wallet']['token'], data['wallet']['balance']), (str(self.merchant_wallet.token), '3.00'))
+        self.assertEqual(data['transaction']['id'], txn.pk)
+
+
+    async def test_merchants_only_subscribe_to_wallets_they_charged(self):
+        rival = await User.objects.acreate(email='rival@example.com', user_type='merchant')
+        rival_wallet = await Wallet.objects.acreate(user=rival, is_merchant=True)
+        await sync_to_async(self.debit)(self.wallet, Decimal('1.00'))
+        headers = {'Authorization': f'Bearer {issue_token(self.merchant)}'}
+        for wallet in (rival_wallet, self.other_wallet):
+            response = await self.async_client.get('/wallets/async/events/', {'wallet': str(wallet.token)}, headers=headers)
+            self.assertEqual(response.status_code, 404)
+
+        response = await self.async_client.get('/wallets/async/events/', {'wallet': str(self.wallet.token)}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        frames = aiter(response.streaming_content)
+        try:
+            await self.next_frame(frames)
+            await sync_to_async(self.credit)(self.wallet, Decimal('5.00'))
+            recharge = json.loads((await self.next_frame(frames)).strip().split('\n')[2].removeprefix('data: '))
+            txn = await sync_to_async(self.debit)(self.wallet, Decimal('2.00'))
+            charge = json.loads((await self.next_frame(frames)).strip().split('\n')[2].removeprefix('data: '))
+        finally:
+            await frames.aclose()
+        self.assertEqual((recharge['wallet']['balance'], recharge['transaction']), ('104.00', None))
+        self.assertEqual(charge['transaction']['id'], txn.pk)
+
+
+class ClientWalletListTests(WalletTestCase):
+
+    def walk(self, client, url):
+        """ Follow the next links from url, returns the tokens listed and the number of pages """
+        tokens, pages = [], 0
+        while url:
+            data = client.get(url).json()
+            tokens += [row['token'] for row in data['results']]
+            url, pages = data['next'], pages + 1
+        return tokens, pages
+
+    def merchant_client(self):
+        return Client(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.merchant)}')
+
+    def test_pages(self):
+        # Most recently active first
+        expected = [str(self.other_wallet.token), str(self.wallet.token)]
+        client = self.merchant_client()
+        for url in ('/wallets/client-wallets/?page_size=1', '/wallets/async/client-wallets/?page_size=1'):
+            self.assertEqual(self.walk(client, url), (expected, 2), url)
+        self.assertEqual(self.api(self.client_user).get('/wallets/client-wallets/').status_code, 403)
+
+    def test_rows_match_the_serializer(self):
+        response = self.api(self.merchant).get(f'/wallets/client-wallets/?token={self.wallet.token}')
+        status = JSONRenderer().render(WalletStatusSerializer(Wallet.objects.get(pk=self.wallet.pk)).data)
+        self.assertIn(b'"results":[' + status + b']', response.content)
+
+    def test_filters(self):
+        ledger.credit(self.wallet, Decimal('1.00'))
+        client = self.merchant_client()
+        filters = {
+            f'token={str(self.other_wallet.token)[:8].upper()}': [self.other_wallet],
+            f'email={self.client_user.email}': [self.wallet],
+            'min_balance=90&max_balance=100': [self.other_wallet],
+            'min_balance=100.01': [self.wallet],
+            'active_until=2000-01-01T00:00:00Z': [],
+        }
+        for query, wallets in filters.items():
+            for url in ('/wallets/client-wallets/', '/wallets/async/client-wallets/'):
+                results = client.get(f'{url}?{query}').json()['results']
+                self.assertEqual([row['token'] for row in results], [str(wallet.token) for wallet in wallets], query)
+        self.assertEqual(client.get('/wallets/client-wallets/?token=xyz').status_code, 400)
+
+    def test_page_size_is_capped(self):
+        Wallet.objects.bulk_create([Wallet(user=self.client_user) for _ in range(501)])
+        results = self.api(self.merchant).get('/wallets/client-wallets/?page_size=100000').json()['results']
+        self.assertEqual(len(results), 500)
+
+    def test_not_modified(self):
+        client = self.api(self.merchant)
+        etag = client.get('/wallets/client-wallets/')['ETag']
+        self.assertEqual(client.get('/wallets/client-wallets/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ledger.credit(self.other_wallet, Decimal('1.00'))
+        self.assertEqual(client.get('/wallets/client-wallets/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
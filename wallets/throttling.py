@@ -0,0 +1,130 @@
+"""
+Token-bucket admission control for the balance mutating endpoints.
+
+Buckets are configured in TOKEN_BUCKET_RATES as {'burst': n, 'rate': r}: up to n requests at
+once, refilled at r requests per second. There is one bucket per user, sized by its user_type
+(the 'merchant' and 'client' entries), and one per mutated wallet (the 'wallet' entry; for
+recharges the wallet named in the body, not the one of the URL), so neither a single
+integration nor a single hot wallet can monopolise the workers. Only recharges read the body:
+other endpoints ignore its token, which would otherwise let any request pick its own bucket.
+
+Bucket state lives in the THROTTLE_CACHE_ALIAS cache and is only changed with atomic add/incr:
+each bucket is a pair of fixed windows of burst / rate seconds and its level is estimated from
+the current window count plus the previous one weighted by the part of it still in range
+(a sliding window approximation of the token bucket). The throttles run in DRF's initial(),
+after authentication and permissions but before any ORM work or serializer validation.
+Allowed and rejected requests are counted in the metrics registry (see wallet_service.metrics).
+"""
+
+import math
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from wallet_service.metrics import registry
+
+KEY_PREFIX = 'throttle'
+
+
+def get_cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def get_rates():
+    return getattr(settings, 'TOKEN_BUCKET_RATES', {})
+
+
+def consume(scope, ident):
+    """ Take a token from the bucket of (scope, ident), returns the seconds to wait or None if allowed """
+    config = get_rates().get(scope)
+    if not config:
+        return None
+    burst, rate = config['burst'], config['rate']
+    window = burst / rate
+    position = time.time() / window
+    index = int(position)
+    key = f'{KEY_PREFIX}:{scope}:{ident}:{index}'
+    cache = get_cache()
+    timeout = math.ceil(window * 2)
+    cache.add(key, 0, timeout)
+    try:
+        current = cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.add(key, 1, timeout)
+        current = 1
+    previous = cache.get(f'{KEY_PREFIX}:{scope}:{ident}:{index - 1}', 0)
+    level = previous * (1 - (position - index)) + current
+    allowed = level <= burst
+    registry.record_throttle(scope, allowed)
+    return None if allowed else (level - burst) / rate
+
+
+def wallet_ident(token):
+    """ Canonical form of a wallet token for its bucket, None if it is not a valid token """
+    try:
+        return str(uuid.UUID(str(token)))
+    except ValueError:
+        return None
+
+
+def recharged_wallet_token(url_token, data):
+    """
+    Token of the wallet a recharge changes: recharges credit the wallet named by the token of
+    their body, which may differ from the one in the URL.
+    """
+    body_token = data.get('token') if isinstance(data, dict) else None
+    return wallet_ident(body_token) or wallet_ident(url_token)
+
+
+def check(user, token=None):
+    """ Seconds to wait before the user may mutate the wallet with this token, None if it may now """
+    wait = consume(getattr(user, 'user_type', None), user.pk)
+    if wait is None and token is not None:
+        wait = consume('wallet', wallet_ident(token) or token)
+    return wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """ Base class, get_bucket returns the (scope, ident) to take a token from or None """
+
+    def get_bucket(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        bucket = self.get_bucket(request, view)
+        self._wait = consume(*bucket) if bucket is not None else None
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
+
+
+class UserTypeThrottle(TokenBucketThrottle):
+    """ One bucket per user, sized by the user's user_type """
+
+    def get_bucket(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return request.user.user_type, request.user.pk
+
+
+class WalletTokenThrottle(TokenBucketThrottle):
+    """ One bucket per wallet of the URL """
+
+    def get_wallet_token(self, request, view):
+        return wallet_ident(view.kwargs.get('token'))
+
+    def get_bucket(self, request, view):
+        token = self.get_wallet_token(request, view)
+        return ('wallet', token) if token is not None else None
+
+
+class RechargeWalletThrottle(WalletTokenThrottle):
+    """ One bucket per recharged wallet, see recharged_wallet_token """
+
+    def get_wallet_token(self, request, view):
+        return recharged_wallet_token(view.kwargs.get('token'), request.data)
@@ -1,7 +1,8 @@
 # wallets/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import WalletViewSet, TransactionViewSet, ClientWalletsListView
+from .views import WalletViewSet, TransactionViewSet, ClientWalletsListView, QueuedRechargeView, WalletCacheStatsView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'wallets', WalletViewSet)
@@ -11,4 +12,13 @@ router.register(r'transactions', TransactionViewSet, basename='transaction')
 urlpatterns = [
     path('', include(router.urls)),
     path('client-wallets/', ClientWalletsListView.as_view(), name='client-wallets-list'),
+    path('recharges/<uuid:pk>/', QueuedRechargeView.as_view(), name='queued-recharge-detail'),
+    path('cache-stats/', WalletCacheStatsView.as_view(), name='wallet-cache-stats'),
+    # Async variants of the hot endpoints, for deployments served through ASGI
+    path('async/wallet/', async_views.AsyncWalletDetailView.as_view(), name='async-wallet-detail'),
+    path('async/client-wallets/', async_views.AsyncClientWalletsListView.as_view(), name='async-client-wallets-list'),
+    path('async/transactions/', async_views.AsyncTransactionListView.as_view(), name='async-transaction-list'),
+    path('async/events/', async_views.AsyncWalletEventsView.as_view(), name='async-wallet-events'),
+    path('async/wallets/<uuid:token>/charge/', async_views.AsyncWalletChargeView.as_view(), name='async-wallet-charge'),
+    path('async/wallets/<uuid:token>/recharge/', async_views.AsyncWalletRechargeView.as_view(), name='async-wallet-recharge'),
 ] + router.urls
\ No newline at end of file
@@ -1,17 +1,26 @@
+import uuid
+
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Wallet, Transaction
-from rest_framework import viewsets
-from .serializers import WalletCreateSerializer, WalletStatusSerializer, TransactionSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .models import Wallet, TransactionHistory, QueuedRecharge
+from rest_framework import generics, viewsets
+from .serializers import WalletCreateSerializer, WalletStatusSerializer, TransactionSerializer, TransactionExportSerializer
 from rest_framework.decorators import action
 from rest_framework import status
-from .serializers import WalletRechargeSerializer, WalletChargeSerializer
+from .serializers import WalletRechargeSerializer, WalletChargeSerializer, WalletChargeBatchSerializer, QueuedRechargeSerializer
+from .serializers import StatementQuerySerializer, StatementSerializer, AnalyticsQuerySerializer, AnalyticsSerializer, LedgerEntrySerializer
+from .serializers import ClientWalletFilterSerializer
 from .permissions import IsClient, IsMerchant
+from .idempotency import idempotent
+from .throttling import RechargeWalletThrottle, UserTypeThrottle, WalletTokenThrottle
+from .pagination import TransactionCursorPagination, WalletCursorPagination
+from .exports import export_response
+from . import analytics, cache as wallet_cache, conditional, fast_serializers, ledger, recharge_queue, snapshots
 
 class WalletViewSet(viewsets.ModelViewSet):
     """
@@ -25,10 +34,16 @@ class WalletViewSet(viewsets.ModelViewSet):
     Create a new wallet instance.
 
     recharge:
-    Recharge a wallet balance.
+    Recharge a wallet balance. In write-behind mode the recharge is queued and answered with 202.
 
     charge:
     Charge a client's wallet.
+
+    charge_batch:
+    Charge many client wallets in a single request.
+
+    statement:
+    Summarise a wallet's movements over a period of days.
     """
     queryset = Wallet.objects.all()
     serializer_class = WalletStatusSerializer
@@ -52,18 +67,49 @@ class WalletViewSet(viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the wallet status from the cache, falling back to the database on a miss.
+        ETag / Last-Modified come from the entry's updated_at, 304 when the client's copy is current.
+        """
+        # Canonical form: the cache key and the ETag must not depend on how the URL spells the token
+        try:
+            token = str(uuid.UUID(self.kwargs[self.lookup_field]))
+        except ValueError:
+            raise Http404
+        entry = wallet_cache.get_wallet_status(token, loader=lambda: Wallet.objects.filter(token=token).first())
+        # Same visibility rules as get_queryset: merchants see every wallet, clients only their own
+        if entry is None or (request.user.user_type != 'merchant' and entry['user_id'] != request.user.pk):
+            raise Http404
+        etag, last_modified = conditional.wallet_status_validators(request, entry)
+        return conditional.respond(request, etag, last_modified, lambda: Response(entry['data']))
+
+    def perform_create(self, serializer):
+        wallet = serializer.save()
+        wallet_cache.invalidate_user(wallet.user_id)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsClient])
-    def recharge(self, request, pk=None):
+    def perform_destroy(self, instance):
+        wallet_cache.invalidate(instance.token)
+        wallet_cache.invalidate_user(instance.user_id)
+        instance.delete()
+
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsClient], throttle_classes=[UserTypeThrottle, RechargeWalletThrottle])
+    @idempotent
+    def recharge(self, request, token=None):
         wallet = self.get_object()
         serializer = WalletRechargeSerializer(data=request.data, context={'wallet': wallet})
         if serializer.is_valid():
+            if recharge_queue.is_enabled():
+                queued = serializer.enqueue(request.user)
+                return Response(QueuedRechargeSerializer(queued).data, status=status.HTTP_202_ACCEPTED)
             with transaction.atomic():
                 serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsMerchant])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsMerchant], throttle_classes=[UserTypeThrottle, WalletTokenThrottle])
+    @idempotent
     def charge(self, request, token=None):
         """Charge a client's wallet."""
         if request.user.user_type != 'merchant':
@@ -71,12 +117,10 @@ class WalletViewSet(viewsets.ModelViewSet):
     
         try:
             wallet = get_object_or_404(Wallet, token=token)
-            print(f"Wallet found: {wallet.token}")
         except Wallet.DoesNotExist:
-            print("Wallet not found")
             return Response({"message": "Wallet not found"}, status=404)
         
-        serializer = WalletChargeSerializer(data=request.data, context={'wallet': wallet})
+        serializer = WalletChargeSerializer(data=request.data, context={'wallet': wallet, 'merchant': request.user})
         if serializer.is_valid():
             try:
                 with transaction.atomic():
@@ -85,32 +129,171 @@ class WalletViewSet(viewsets.ModelViewSet):
             except ValidationError as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='charge-batch', permission_classes=[IsAuthenticated, IsMerchant], throttle_classes=[UserTypeThrottle])
+    @idempotent
+    def charge_batch(self, request):
+        """Charge a list of {token, amount} pairs and report the outcome of each one."""
+        data = {'charges': request.data} if isinstance(request.data, list) else request.data
+        serializer = WalletChargeBatchSerializer(data=data, context={'merchant': request.user})
+        if serializer.is_valid():
+            results = serializer.save()
+            return Response({'results': results}, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def statement(self, request, token=None):
+        """
+        Opening/closing balance and charge/recharge totals between start and end (days, both included),
+        computed from the daily snapshots. With as_of, also returns the balance at that moment.
+        """
+        wallet = self.get_object()
+        params = StatementQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        query = params.validated_data
+        result = snapshots.statement(wallet, query['start'], query['end'])
+        result.update(start=query['start'], end=query['end'])
+        if 'as_of' in query:
+            result.update(as_of=query['as_of'], balance_as_of=snapshots.balance_as_of(wallet, query['as_of']))
+        return Response(StatementSerializer(result).data)
+
 class WalletDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):
-        try:
-            wallet = Wallet.objects.get(user=request.user)
-            serializer = WalletStatusSerializer(wallet)
-            return Response(serializer.data)
-        except Wallet.DoesNotExist:
+        def load():
+            try:
+                return Wallet.objects.get(user=request.user)
+            except Wallet.DoesNotExist:
+                return None
+
+        entry = wallet_cache.get_user_wallet_status(request.user.pk, loader=load)
+        if entry is None:
             return Response({"message": "Wallet not found"}, status=404)
+        etag, last_modified = conditional.wallet_status_validators(request, entry)
+        return conditional.respond(request, etag, last_modified, lambda: Response(entry['data']))
 
 class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
+
+    def _lists_merchant_entries(self):
+        return self.action == 'list' and self.request.user.user_type == 'merchant'
+
+    def get_serializer_class(self):
+        if self._lists_merchant_entries():
+            return LedgerEntrySerializer
+        return TransactionSerializer
 
     def get_queryset(self):
         user = self.request.user
+        if self._lists_merchant_entries():
+            # Merchants see the charges they made, listed from the credit legs of their wallet
+            return ledger.merchant_entries(user).select_related('transaction__wallet')
         if user.user_type == 'merchant':
-            # Assuming merchants can see all transactions they are involved in
-            return Transaction.objects.filter(wallet__user=user)
-        return Transaction.objects.filter(wallet__user=user)  # Clients can see their transactions
+            return ledger.merchant_transactions(user).select_related('wallet')
+        # select_related avoids a query per row when the serializer reads the wallet token
+        return TransactionHistory.objects.select_related('wallet').filter(wallet__user=user)  # Clients can see their transactions
 
-class ClientWalletsListView(APIView):
+    def list(self, request, *args, **kwargs):
+        """
+        JSON pages are rendered by fast_serializers from values() rows, with the same bytes as
+        the serializers would produce; other formats (the browsable API) go through them.
+        Transactions are immutable, so the id and created_at of the newest visible row (one indexed
+        query) validate every page: 304 when nothing was added since the client's copy.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        # Read from the end of the (wallet, created_at, id) index instead of aggregating the whole history
+        latest = queryset.order_by('-created_at', '-id').values('id', 'created_at').first() or {'id': None, 'created_at': None}
+        etag = conditional.make_etag(request, request.user.pk, latest['id'])
+        return conditional.respond(request, etag, latest['created_at'], lambda: self._list(request, queryset, *args, **kwargs))
+
+    def _list(self, request, queryset, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        prefix = 'transaction__' if self._lists_merchant_entries() else ''
+        rows = queryset.values('id', 'created_at', **fast_serializers.transaction_values(prefix))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return fast_serializers.json_response(fast_serializers.transactions(rows))
+        return fast_serializers.json_response({
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+            'results': fast_serializers.transactions(page),
+        })
+
+    def _visible_transactions(self):
+        if self.request.user.user_type == 'merchant':
+            return ledger.merchant_transactions(self.request.user)
+        return TransactionHistory.objects.filter(wallet__user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the transaction history as NDJSON (default) or CSV.
+        Accepts start, end, transaction_type, status and output (ndjson or csv) query parameters.
+        """
+        params = TransactionExportSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = params.filter_queryset(self._visible_transactions())
+        return export_response(queryset, params.validated_data['output'])
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsMerchant])
+    def analytics(self, request):
+        """
+        Count, total and average amount plus an hourly or daily histogram, aggregated in SQL.
+        Accepts start, end, transaction_type, status and interval (hour or day) query parameters.
+        """
+        params = AnalyticsQuerySerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = params.filter_queryset(self._visible_transactions())
+        result = analytics.cached_summary(request.user, queryset, params.validated_data)
+        return Response(AnalyticsSerializer(result).data)
+
+class ClientWalletsListView(generics.GenericAPIView):
+    """
+    Client wallets, most recently active first, a cursor page at a time.
+    Accepts token (prefix), email, min_balance, max_balance, active_since and active_until
+    query parameters. Rows are read with values() and rendered by fast_serializers; the page
+    itself validates the ETag, so a 304 costs the page query and nothing else.
+    """
     permission_classes = [IsAuthenticated, IsMerchant]
+    pagination_class = WalletCursorPagination
+
+    def get_queryset(self):
+        return Wallet.objects.filter(user__user_type='client')
+
+    def get(self, request, *args, **kwargs):
+        params = ClientWalletFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        rows = params.filter_queryset(self.get_queryset()).values('id', *fast_serializers.WALLET_STATUS_FIELDS)
+        page = self.paginate_queryset(rows)
+        links = (self.paginator.get_next_link(), self.paginator.get_previous_link())
+        etag = conditional.make_etag(request, *links, *[(row['token'], row['updated_at']) for row in page])
+        last_modified = max((row['updated_at'] for row in page), default=None)
+        return conditional.respond(request, etag, last_modified, lambda: self._page(request, page, links))
+
+    def _page(self, request, page, links):
+        data = {'next': links[0], 'previous': links[1], 'results': fast_serializers.wallet_statuses(page)}
+        if request.accepted_renderer.format == 'json':
+            return fast_serializers.json_response(data)
+        return Response(data)
+
+class QueuedRechargeView(generics.RetrieveAPIView):
+    """ Status of a recharge accepted in write-behind mode, for polling its outcome """
+    serializer_class = QueuedRechargeSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return QueuedRecharge.objects.select_related('wallet').filter(user=self.request.user)
+
+class WalletCacheStatsView(APIView):
+    """ Hit/miss counters of the wallet status cache for this process """
+    permission_classes = [IsAdminUser]
 
     def get(self, request, *args, **kwargs):
-        wallets = Wallet.objects.filter(user__user_type='client')
-        serializer = WalletStatusSerializer(wallets, many=True)
-        return Response(serializer.data)
+        return Response(wallet_cache.stats())